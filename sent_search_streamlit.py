@@ -1,312 +1,152 @@
+# The page only imports streamlit and the light wordfinder modules. The processing engine (pandas, numpy,
+# fuzzywuzzy) is imported by load_engine the first time files are uploaded, so page views that only read the FAQ
+# never pay for it.
 import streamlit as st
-import xml.etree.ElementTree as ET
-import zipfile
 import os
-import io
-import tempfile
-from tempfile import NamedTemporaryFile
-from collections import defaultdict
-from fuzzywuzzy import fuzz
-import re
-import pandas as pd
-import numpy as np
-import csv
-import time
-
-#FUNCTIONS TO PROCESS THE WORD DOC AND XML------------------------------------
-def unzip_word_document(docx_path, extract_to_folder):
-    # Ensure the output folder exists
-    if not os.path.exists(extract_to_folder):
-        os.makedirs(extract_to_folder)
-    try:
-        with zipfile.ZipFile(docx_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_to_folder)
-        print(f"Word document unzipped successfully to {extract_to_folder}")
-    except zipfile.BadZipFile:
-        print(f"The file {docx_path} is not a valid ZIP archive.")
-    except Exception as e:
-        print(f"An error occurred: {e}")
-
-# Function to unzip a DOCX file and process its content
-def unzip_docx(docx_file):
-    # Create a temporary directory
-    temp_dir = tempfile.mkdtemp()
-
-    # In case the temp_dir already exists for some reason, we remove and retry
-    if os.path.exists(temp_dir):
-        os.rmdir(temp_dir)
-        temp_dir = tempfile.mkdtemp()
-    
-    # Unzip the .docx file (it's essentially a ZIP file)
-    with zipfile.ZipFile(docx_file, 'r') as zip_ref:
-        zip_ref.extractall(temp_dir)
-    
-    return temp_dir
-
-def parse_xml(file_path):
-    """Parse the XML file and return the root element."""
-    tree = ET.parse(file_path)
-    return tree.getroot()
-
-def extract_matches(root):
-    """Extract relevant matches from the XML and return them as a list."""
-    combined_matches = []
-    for elem in root.iter():
-        if elem.tag in [
-            r'{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t', 
-            r'{http://schemas.openxmlformats.org/wordprocessingml/2006/main}p', 
-            r'{http://schemas.openxmlformats.org/wordprocessingml/2006/main}lastRenderedPageBreak'
-        ]:
-            combined_matches.append(elem)
-    return combined_matches
-
-def write_matches_to_log(matches, logger = False, log_file = "xml_parsed_log.txt"):
+import logging
+from wordfinder.budgets import ScanBudget, UploadRejected
+from wordfinder.cache import content_hash
+from wordfinder.jobs import JOB_RUNNER, JobQueueFull
+from wordfinder.metrics import ScanMetrics, profile_to
+
+# worker processes used for matching large documents (see POOL_MIN_PAIRS), set WORDFINDER_WORKERS=1 to always match in
+# the streamlit process
+MATCH_WORKERS = int(os.environ.get('WORDFINDER_WORKERS', os.cpu_count() or 1))
+# split between the scans that may run at once so concurrent users do not oversubscribe the CPUs
+JOB_MATCH_WORKERS = max(1, MATCH_WORKERS // JOB_RUNNER.max_running)
+POLL_SECONDS = 0.5 # how often a running scan's progress is redrawn
+# folder for a cProfile dump of every scan, e.g. WORDFINDER_PROFILE_DIR=profiles; unset to not profile
+PROFILE_DIR = os.environ.get('WORDFINDER_PROFILE_DIR')
+
+# the per scan metrics line goes to the server log unless logging was configured elsewhere
+logger = logging.getLogger('wordfinder')
+if not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+PROGRESS_LABELS = {'single': 'Processing single word matches', 'phrase': 'Processing phrase matches'}
+
+@st.cache_resource(show_spinner="Starting the Word Finder...")
+def load_engine():
+    """Import the processing engine and run a tiny scan through it, once per server process."""
+    from wordfinder.engine import warm_up
+    logger.info('engine warmed up in %.3fs', warm_up())
+
+#FUNCTIONS TO RUN THE SCAN IN THE BACKGROUND-------------------------------------
+def scan_job(job, docx_data, word_data, white_data, scan_key, scan_match_key, xml_logger=False, **match_options):
     """
-    Write the matches to a log file, formatted accordingly.
-    Bug: This function does not log page breaks if they happen in a table or other irregular word doc elements some times. 
-        This is because the document.xml of the word document does not have a in line sequential page break tag on such elements like it does regularly.
-
+    Background job scanning one uploaded document. Runs on a JOB_RUNNER thread, so it reports through the job
+    instead of calling streamlit; match_options are handed to match_sentences.
     """
-    xml_parsed = str()
-    page_count = 1
-    for match in matches:
-        if match.tag == r'{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t':
-            xml_parsed += f'{match.text}'
-        elif match.tag == r'{http://schemas.openxmlformats.org/wordprocessingml/2006/main}lastRenderedPageBreak':
-            xml_parsed += f'[lastRenderedPageBreak{page_count}]\n'
-            page_count += 1
-        elif match.tag == r'{http://schemas.openxmlformats.org/wordprocessingml/2006/main}p':
-            xml_parsed += (f'[newParagraph]\n')
-    
-    
-    if logger == True:
-        page_count = 1
-        with open(log_file, 'w') as log:
-            for match in matches:
-                if match.tag == r'{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t':
-                    log.write(f'{match.text}')
-                elif match.tag == r'{http://schemas.openxmlformats.org/wordprocessingml/2006/main}lastRenderedPageBreak':
-                    log.write(f'\n------------[lastRenderedPageBreak{page_count}]------------------------------------------------------------\n\n')
-                    page_count += 1
-                elif match.tag == r'{http://schemas.openxmlformats.org/wordprocessingml/2006/main}p':
-                    log.write(f'\n')
-
-    return xml_parsed
-
-def split_text_on_paragraphs(xml_parsed):
-    """Splits the input text by [newParagraph] and returns the split text."""
-    return re.split(r'(\[newParagraph\])', xml_parsed)
-
-def extract_page_number(part):
-    """Extracts page number from a given part if it contains a page break."""
-    page_match = re.search(r'\[lastRenderedPageBreak(\d+)\]', part)
-    if page_match:
-        return int(page_match.group(1)) + 1
-    return None
-
-def clean_part(part):
-    """Removes unwanted tags like [newParagraph],[lastRenderedPageBreak#] and newline characters."""
-    part = re.sub(r'\[lastRenderedPageBreak\d+\]', '', part)  # Remove the page break tag
-    part = re.sub(r'\[newParagraph\]', '', part)  # Remove [newParagraph] tag
-    part = re.sub(r'\n', '', part)  # Remove newline characters
-    return part
-
-def process_sentences(part, page_number, sentence_list, sentence_id, current_sentence):
-    """Processes the part into sentences and handles combining short sentences."""
-    # Pattern explanation:
-    # (?<!\d)\.   => match a period (.) that is NOT preceded by a digit (\d)
-    # (?=\s|$)    => ensure the period is followed by a space or end of string (optional for better cleanup)
-    sentences = re.split(r'(?<!\d)\.(?=\s|$)', part)
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if sentence:
-            if len(sentence.split()) < 5 and current_sentence:
-                current_sentence += ' ' + sentence
-            else:
-                if current_sentence:
-                    sentence_list.append({'sent_id': sentence_id, 'sentence': current_sentence, 'page': page_number, 'matches':[]})
-                    #sentence_list.append({'sent_id': sentence_id, 'sentence': current_sentence.lower(), 'page': page_number, 'matches':[], 'found_words':[]})
-                    sentence_id += 1
-                current_sentence = sentence
-    return sentence_list, sentence_id, current_sentence
-
-def add_last_sentence(sentence_list, sentence_id, current_sentence, page_number):
-    """Adds the last sentence to the sentence list if there is any."""
-    if current_sentence:
-        sentence_list.append({'sent_id': sentence_id, 'sentence': current_sentence, 'page': page_number, 'matches':[]})
-        #sentence_list.append({'sent_id': sentence_id, 'sentence': current_sentence, 'page': page_number, 'matches':[], 'found_words':[]})
-    return sentence_list
-
-def sentence_convert(xml_parsed):
-    """Main function to process the XML parsed text."""
-    split_text = split_text_on_paragraphs(xml_parsed)
-    sentence_list = []
-    sentence_id = 1
-    page_number = 1
-    current_sentence = ""
-
-    for part in split_text:
-        page_number = extract_page_number(part) or page_number
-        part = clean_part(part)
-        
-        if part.strip():
-            sentence_list, sentence_id, current_sentence = process_sentences(part, page_number, sentence_list, sentence_id, current_sentence)
-    
-    sentence_list = add_last_sentence(sentence_list, sentence_id, current_sentence, page_number)
-    return sentence_list
-
-#FUNCTIONS TO LOAD THE WORD LIST-------------------------------------
-def load_word_list(word_file):
-    # Function to load the words from a given list
-    with open(word_file, 'r') as file:
-        return [line.strip().lower() for line in file.readlines() if line.strip()]
-        #return [line.strip().lower() for line in file.readlines()]
-
-def load_white_list(white_file):
-    # Function to load the words from a given list
-    with open(white_file, 'r') as file:
-        return [line.strip().lower() for line in file.readlines() if line.strip()]
-        #return [line.strip().lower() for line in file.readlines()]
-
-#FUNCTIONS TO CHECK THE SENTENCES AGAINST THE WORD LIST-------------------------------------
-def tokenize_sent(sentence):
-    # Tokenize the sentence into words
-    sent_words = [sent.strip(".,:;()!?\'\"\\") for sent in sentence.split()]
-    return sent_words
-
-def tokenize_word(word_list):
-    # Tokenize the word list into words
-    '''
-        {
-        'word_orig': 'clean energy',
-        'word_tokens': ['clean','energy'],
-        'phrase_type': 'single_word'(or 'multi_word' or 'general'),
-        }
-    '''
-    
-    token_items = []
-    for phrase in word_list:
-        word_tokens = [word.strip(".,:;()!?\'\"\\") for word in phrase.split()]
-        
-        if len(word_tokens) == 1:
-            phrase_type = 'single_word'
-        else:
-            phrase_type = 'multi_word'
-
-        token_items.append({
-            'word_orig': phrase,
-            'word_tokens': word_tokens,
-            'phrase_type': phrase_type
-        })
-
-    return token_items
-
-def check_sentence(sentence_list,word_list,white_list = []): #to compare the sentence to the word list
-    sensitivity = 75
-    similarity_tracker = {}
-    token_word_dict = tokenize_word(word_list)
-    progress_count = 0
-    progress_bar_single = st.progress(progress_count, text='Processing single word matches...')
-
-    #process single word comparisons
-    for sent_item in sentence_list:
-        sentence = sent_item['sentence'].lower()
-        sent_id = sent_item['sent_id']
-        token_sent = tokenize_sent(sentence)
-        similarity_tracker[sent_id] = {}
-        for sent_word in token_sent:
-            similarity_tracker[sent_id][sent_word] = {}
-            for word_phrase in token_word_dict:
-                for word in word_phrase['word_tokens']:
-                    word_ratio = fuzz.ratio(sent_word, word)
-                    similarity_tracker[sent_id][sent_word][word]=word_ratio
-                    if word_phrase['phrase_type'] == 'single_word' and word_ratio >= sensitivity and sent_word not in white_list:
-                        sent_item['matches'].append({
-                            'match': word,
-                            'ratio': word_ratio,
-                            'found': sent_word
-                            })
-        progress_count += 1
-        percent_count = round((progress_count)/len(sentence_list),2)
-        progress_bar_single.progress(percent_count, text=f'Processing single word matches...{percent_count*100}%')
-    progress_bar_single.empty()
-    st.text(f'Processing single word matches completed')
-
-    progress_count = 0
-    progress_bar_multi = st.progress(progress_count, text='Processing phrase matches...')
-    # Iterate through the dictionary for multi-word phrases
-    for sent_id, sent_dict in similarity_tracker.items():
-        qualified_words = []
-        
-        #finds word in sentences that are over 75% matched to word(s) on the list
-        for word, scores in sent_dict.items():
-            # Check if either 'accessible' or 'activism' is over 75
-            sent_sensitivity = []
-            for list_word, score in scores.items():
-                if score > sensitivity:
-                    sent_sensitivity.append(list_word)
-            if sent_sensitivity:
-                qualified_words.append({'found_word':word, 'list_word':sent_sensitivity})
-        
-        # check if all multi-word phrases are found in words that are matched over 75% and add them to the sentence item matches
-        for word_phrase in token_word_dict:
-            if word_phrase['phrase_type'] == 'multi_word':
-                found_words = [q_word.get('found_word', None) for q_word in qualified_words]
-                if all(term in found_words for term in word_phrase['word_tokens']):
-                    words_extract = set(word_phrase['word_tokens']) & set(found_words)
-                    find_dictionary(sentence_list, 'sent_id', sent_id)['matches'].append({
-                        'match': word_phrase['word_orig'],
-                        'ratio': None,
-                        'found': list(words_extract)
-                        })
-        #time.sleep(0.01)
-        progress_count += 1
-        percent_count = round((progress_count)/len(similarity_tracker),2)
-        progress_bar_multi.progress(percent_count, text=f'Processing phrase matches...{percent_count*100}%')
-    progress_bar_multi.empty()
-    st.text(f'Processing phrase matches completed')
+    profile_path = os.path.join(PROFILE_DIR, f'scan_{job.job_id}.prof') if PROFILE_DIR else None
+    with profile_to(profile_path):
+        return run_scan(job, docx_data, word_data, white_data, scan_key, scan_match_key, xml_logger, **match_options)
+
+def run_scan(job, docx_data, word_data, white_data, scan_key, scan_match_key, xml_logger=False, **match_options):
+    """Body of scan_job, timing every stage into the ScanMetrics kept with the result."""
+    from wordfinder import export
+    from wordfinder.engine import RESULT_CACHE, SENTENCE_CACHE, make_scan_result, paragraph_reuse, read_upload, remember_paragraphs
+    from wordfinder.matching import match_sentences_incremental
+    from wordfinder.word_list import cached_compile_word_list
+    metrics = ScanMetrics(**match_options)
+    budget = ScanBudget()
+    job.log("File successfully uploaded!")
+
+    # Stream the document.xml paragraphs straight out of the uploaded DOCX into sentence units
+    job.log("Reading the DOCX file...")
+    fingerprints = []
+    sentence_list = read_upload(docx_data, budget, xml_logger, fingerprints, metrics)
+    job.log('xml parsed')
+    job.log('sentence list created')
+
+    # Load the word list, reusing the compiled list of any earlier run with the same word list and whitelist
+    job.log('word list loaded')
+    if white_data:
+        job.log('whitelist is uploaded')
+        job.log('whitelist loaded')
+    else:
+        job.log('whitelist is not uploaded')
+        job.log('whitelist is not loaded')
+    with metrics.stage('word_list') as stage:
+        compiled = cached_compile_word_list(word_data, white_data)
+        stage.count(list_terms=len(compiled.token_word_dict), list_tokens=len(compiled.list_vocab), whitelist_words=len(compiled.white_ids))
+
+    job.log('processing matches... (this may take a few minutes)')
+
+    # Check the sentences for matches, only rescoring sentences no earlier scan has seen (e.g. edits in a new draft)
+    sentences_reused = match_sentences_incremental(sentence_list, compiled, SENTENCE_CACHE, scan_match_key, progress_callback = budget.guard(job.report), metrics = metrics, budget = budget, **match_options)
+    paragraphs_reused = paragraph_reuse(fingerprints, scan_match_key)
+    metrics.details['sentences_reused'] = sentences_reused
+    metrics.details['paragraphs_reused'] = round(paragraphs_reused, 4)
+    job.log('sentences checked')
+    sentence_share = sentences_reused / len(sentence_list) if sentence_list else 0
+    job.log(f'Reused the matches of {sentences_reused} of {len(sentence_list)} sentences ({round(sentence_share*100)}%), '
+            f'{round(paragraphs_reused*100)}% of paragraphs were unchanged since an earlier scan')
+
+    # Create the DataFrame and the CSV text for the download
+    with metrics.stage('collapse') as stage:
+        collapsed_df = export.collapse_sentence_data(sentence_list)
+        stage.count(rows=len(collapsed_df))
+    job.log("No matches found." if collapsed_df.empty else "✅ Matches found.")
+    metrics.log()
+    scan_result = make_scan_result(sentence_list, collapsed_df, metrics)
+    RESULT_CACHE.put(scan_key, scan_result)
+    # only a finished scan counts as an earlier scan of its paragraphs
+    remember_paragraphs(fingerprints, scan_match_key)
+    return scan_result
+
+@st.fragment(run_every=POLL_SECONDS)
+def show_scan_job(job):
+    """Redraw the progress of a background scan every POLL_SECONDS, rerunning the whole page once it finishes."""
+    state, progress, messages = job.snapshot()
+    if job.finished:
+        st.rerun()
+    if state == 'queued':
+        st.info(f"Other scans are running, yours is number {JOB_RUNNER.queue_position(job)} in line and will start automatically.")
+    else:
+        with st.status("treasure hunting in the text...", expanded=True):
+            for message in messages:
+                st.write(message)
+            for stage, (count, total) in progress.items():
+                if count == total:
+                    st.text(f'{PROGRESS_LABELS[stage]} completed')
+                else:
+                    percent_count = round(count/total,2) if total else 1
+                    st.progress(percent_count, text=f'{PROGRESS_LABELS[stage]}...{percent_count*100}%')
+    if st.button("Cancel"):
+        JOB_RUNNER.cancel(job)
+        st.rerun()
 
 #utility functions
-def max_ignore_none(data):
-    filtered_data = [x for x in data if x is not None]
-    return max(filtered_data) if filtered_data else None
-
-def find_dictionary(list_of_dictionaries, key, value):
-    for dictionary in list_of_dictionaries:
-        if dictionary.get(key) == value:
-            return dictionary
-    return None # or raise an exception if no match is found
-
-#FUNCTIONS TO EXPORT THE DATA-------------------------------------
-# Helper function to concatenate lists and strings
-def concat_lists_strings(series):
-    # Flatten lists and join with commas
-    return ', '.join(set((map(str, [item for sublist in series for item in (sublist if isinstance(sublist, list) else [sublist])]))))
-
-# Function to process and collapse sentence list into a DataFrame
-def collapse_sentence_data(sentence_list):
-    # Create the DataFrame
-    df = pd.json_normalize(sentence_list, 'matches', ['sent_id', 'sentence', 'page'], errors='ignore')
-    if 'match' not in df.columns or df['match'].dropna().empty:
-        st.warning("No matches found.")
-        collapsed_df = pd.DataFrame()
-        return collapsed_df
-    else:
-        st.write("✅ Matches found.")
-        # Grouping by 'sent_id' and applying the aggregation
-        collapsed_df = df.groupby('sent_id').agg(
-            list_matchs=('match', lambda x: concat_lists_strings(x)),  # Concatenate match strings
-            found_words=('found', lambda x: concat_lists_strings(x)),  # Concatenate found strings
-            match_certainty=('ratio', lambda x: max(filter(lambda y: y is not None, x), default=None)),  # Take max of ratio, ignore None
-            sentence=('sentence', 'first'),  # Take the first sentence for each group
-            page_at_or_below=('page', 'first')  # Take the first page for each group
-        ).reset_index()
-
-        return collapsed_df
+def uploaded_file_hash(uploaded_file):
+    """Content hash of an uploaded file, remembered per upload in the session so reruns do not rehash it."""
+    file_hashes = st.session_state.setdefault('file_hashes', {})
+    file_id = getattr(uploaded_file, 'file_id', None)
+    if file_id is None or file_id not in file_hashes:
+        file_hash = content_hash(uploaded_file.getvalue())
+        if file_id is None:
+            return file_hash
+        file_hashes[file_id] = file_hash
+    return file_hashes[file_id]
+
+def export_table(scan_result, export_format, export_metrics):
+    """
+    Download data of the collapsed table. The export is timed as the 'export' stage of a copy of the scan's metrics,
+    kept in export_metrics by format: the ScanResult is shared with every session through RESULT_CACHE and is
+    never changed.
+    """
+    from wordfinder import export
+    metrics = scan_result.metrics.copy()
+    with metrics.stage('export') as stage:
+        data = export.table_bytes(scan_result.collapsed_df, export_format)
+        stage.count(bytes=len(data))
+    export_metrics[export_format] = metrics
+    return data
 
 # RUNNING THE MAIN FUNCTION--------------------------------------
 def main():
     """Main function to parse the XML, extract matches, and write them to a log."""
+    xml_logger = False # write the parsed paragraphs to xml_parsed_log.txt for debugging
     # Streamlit UI
     
     # Remove whitespace from the top of the page and sidebar
@@ -358,117 +198,115 @@ def main():
         st.header("Upload a Specific List of Words You Want to :red[Exclude]")
         uploaded_whitelist_txt = st.file_uploader(":grey[Words on excluded word list will override words on the search word list. Must choose a TXT file. Make sure your TXT file word list is structured correctly. See [Word List Structure Rules](#txt-format) below. *This does not exclude phrases at the moment.*]", type=["txt"], key = "txt_uploader_whitelist")
 
+    phrase_order = st.toggle("Too many phrase matches? Only match phrases whose words appear in order and close together")
+    phrase_gap = None
+    if phrase_order:
+        phrase_gap = st.number_input(":grey[Most words allowed between the words of a phrase]", min_value=0, max_value=50, value=2, step=1)
+
+    match_modes = {
+        'Similar words (slowest, finds misspellings)': 'fuzzy',
+        'Exact words first, similar words for the rest': 'exact_first',
+        'Exact words and phrases only (fastest)': 'exact',
+    }
+    match_mode = match_modes[st.selectbox(":grey[How closely should words match?]", list(match_modes))]
+
+    best_match = st.toggle("Too many similar words matching one word? Only keep the closest word list match for each word")
+    top_k = 1 if best_match else None
+
     # Streamlit app to display instructions
     
+    # load the engine as soon as the first file arrives, it is ready by the time the second one is uploaded
+    if uploaded_docx is not None or uploaded_txt is not None:
+        load_engine()
+
     if uploaded_docx is not None and uploaded_txt is not None:
+        from wordfinder import export
+        from wordfinder.engine import RESULT_CACHE, match_key, result_key
+        from wordfinder.word_list import word_list_key
+        word_data = uploaded_txt.getvalue()
+        white_data = uploaded_whitelist_txt.getvalue() if whitelist_incl and uploaded_whitelist_txt is not None else b''
+        # results are cached per document, word list, whitelist and matching options so reruns never rescan
+        word_key = word_list_key(word_data, white_data)
+        scan_key = result_key(uploaded_file_hash(uploaded_docx), word_key, phrase_gap=phrase_gap, match_mode=match_mode, top_k=top_k)
+
+        scan_match_key = match_key(word_key, phrase_gap=phrase_gap, match_mode=match_mode, top_k=top_k)
+
         # Display the button to process files
         if st.button("Process Files"):
-            # Save the DOCX and TXT files temporarily
-            with NamedTemporaryFile(delete=False, mode="wb") as docx_tmp:
-                docx_tmp.write(uploaded_docx.getvalue())
-                word_docx = docx_tmp.name
-            
-            with NamedTemporaryFile(delete=False, mode="wb") as txt_tmp:
-                txt_tmp.write(uploaded_txt.getvalue())
-                word_list_docx = txt_tmp.name
-            
-            if whitelist_incl:
-                if uploaded_whitelist_txt is not None :
-                    with NamedTemporaryFile(delete=False, mode="wb") as txt_white_tmp:
-                        txt_white_tmp.write(uploaded_whitelist_txt.getvalue())
-                        white_list_docx = txt_white_tmp.name
-
-            with st.status("treasure hunting in the text..."):
-                st.write("File successfully uploaded!")
-                
-                # Unzip the DOCX file
-                st.write("Unzipping the DOCX file...")
-                temp_dir = unzip_docx(word_docx)
-                
-
-                # Process the unzipped DOCX contents (e.g., extract text from the document.xml file)
-                document_xml_path = os.path.join(temp_dir, 'word', 'document.xml')
-
-                #unzip_word_document(word_docx)
-
-                #xml_file = 'word/document.xml'
-                
-                # Parse XML and extract matches
-                root = parse_xml(document_xml_path)
-                matches = extract_matches(root)
-                st.write('xml parsed')
-                
-                # Write the matches to a log file
-                xml_parsed = write_matches_to_log(matches, logger = False)
-                st.write('xml written')
-
-                # Turn xml into sentence units
-                sentence_list = sentence_convert(xml_parsed)
-                st.write('sentence list created')
-                
-                # Load the word list
-                word_list = load_word_list(word_list_docx)
-                st.write('word list loaded')
-
-                # Load the uploaded file
-                if whitelist_incl:
-                    if uploaded_whitelist_txt is not None:
-                        st.write('whitelist is uploaded')
-                        whitelist = load_white_list(white_list_docx)
-                        wh_uploaded = True
-                        st.write('whitelist loaded')
-                    else:
-                        st.write('whitelist is not uploaded')
-                        whitelist = []
-                        wh_uploaded = False
-                        st.write('whitelist is not loaded')
+            scan_result = RESULT_CACHE.get(scan_key)
+            running_job = st.session_state.get('scan_job')
+            if scan_result is not None:
+                st.info("These files were already processed with these settings, showing the saved results.")
+                st.session_state['scan_result'] = (scan_key, scan_result)
+            elif running_job is None or running_job[0] != scan_key or running_job[1].finished:
+                # one scan per session, a new scan replaces one still running for other files or settings
+                if running_job is not None:
+                    JOB_RUNNER.cancel(running_job[1])
+                    del st.session_state['scan_job']
+                try:
+                    job = JOB_RUNNER.submit(scan_job, uploaded_docx.getvalue(), word_data, white_data, scan_key, scan_match_key, xml_logger,
+                                            workers = JOB_MATCH_WORKERS, phrase_gap = phrase_gap, match_mode = match_mode, top_k = top_k)
+                    st.session_state['scan_job'] = (scan_key, job)
+                except JobQueueFull:
+                    st.error("The Word Finder is busy with other scans right now. Please try again in a few minutes.")
+
+        # follow the background scan of these inputs and attach its result to the session once it finishes
+        running_job = st.session_state.get('scan_job')
+        if running_job is not None and running_job[0] == scan_key:
+            job = running_job[1]
+            if not job.finished:
+                show_scan_job(job)
+            else:
+                del st.session_state['scan_job']
+                if job.state == 'done':
+                    st.session_state['scan_result'] = (scan_key, job.result)
+                elif isinstance(job.error, UploadRejected):
+                    st.error(str(job.error))
+                elif job.state == 'failed':
+                    st.error(f"Something went wrong while processing the files: {job.error}")
                 else:
-                    st.write('whitelist is not uploaded')
-                    whitelist = []
-                    wh_uploaded = False
-                    st.write('whitelist is not loaded')
-
-                st.write('processing matches... (this may take a few minutes)')
-
-                # Check the sentences for matches
-                check_sentence(sentence_list, word_list, whitelist)
-                st.write('sentences checked')
-
-                # Create the DataFrame
-                collapsed_df = collapse_sentence_data(sentence_list)
-
-            if collapsed_df.empty:
+                    st.warning("Processing cancelled.")
+
+        # keep showing the result of these exact inputs across reruns, e.g. after toggling an option or downloading
+        saved_result = st.session_state.get('scan_result')
+        if saved_result is not None and saved_result[0] == scan_key:
+            scan_result = saved_result[1]
+            # metrics of the downloads of this session, by format, for the result on screen
+            if st.session_state.get('export_metrics', (None,))[0] != scan_key:
+                st.session_state['export_metrics'] = (scan_key, {})
+            export_metrics = st.session_state['export_metrics'][1]
+            export_format = None
+            if scan_result.collapsed_df.empty:
                 st.warning("No Matches Found. No CSV generated. Looks like you're good to go!")
             else:
-                # Save the DataFrame to a CSV file
-                csv_buffer = io.StringIO()
-                collapsed_df.to_csv(csv_buffer, encoding='utf-8-sig', index=False)
-                csv_data = csv_buffer.getvalue()
                 st.success('Matches Found! Collaped data saved to CSV. Time to get to work!')
 
-                # Create a download button for the CSV file
+                # Create a download button for the matches file, rendered only once it is clicked
+                format_labels = {'csv': 'CSV', 'xlsx': 'Excel (XLSX)', 'parquet': 'Parquet'}
+                export_format = st.selectbox(":grey[File format]", [export_format for export_format in format_labels if export_format in export.available_formats()],
+                                             format_func=format_labels.get)
+                extension, mime, modules = export.EXPORT_FORMATS[export_format]
                 st.download_button(
                 label="Download Generated Files",
-                data=csv_data,
-                file_name="wordfinder_matches.csv",
-                mime="text/csv",
+                data=lambda: export_table(scan_result, export_format, export_metrics),
+                file_name=f"wordfinder_matches{extension}",
+                mime=mime,
+                )
+
+            # timings and counts of every stage of the scan, also offered as a JSON file next to the matches
+            shown_metrics = export_metrics.get(export_format, scan_result.metrics)
+            with st.expander("Scan metrics"):
+                st.dataframe(shown_metrics.rows(), hide_index=True)
+                st.download_button(
+                label="Download Scan Metrics",
+                data=lambda: shown_metrics.to_json(),
+                file_name="wordfinder_matches_metrics.json",
+                mime="application/json",
                 )
 
             # Display the collapsed DataFrame
-            #print(sentence_list)
-            #print(collapsed_df)
-
-            # Clean up the temporary directory where the DOCX contents were extracted
-            for root, dirs, files in os.walk(temp_dir, topdown=False):
-                for name in files:
-                    os.remove(os.path.join(root, name))
-                for name in dirs:
-                    os.rmdir(os.path.join(root, name))
-            os.rmdir(temp_dir)
-
-            # Clean up the temporary files
-            os.remove(word_docx)
-            os.remove(word_list_docx)
+            #print(scan_result.sentence_list)
+            #print(scan_result.collapsed_df)
     
     st.divider()
 
@@ -488,6 +326,15 @@ def main():
         wilting flowers
         """)
         
+        st.markdown("""
+        Words match similar words with a match certainty of 75 or more. To make a word stricter or looser, end its line with `|` and the lowest certainty it should accept (1-100). For example `ada | 100` only finds ada exactly, while `decarbonization | 65` also finds more distant spellings. Phrases are always matched on their exact words.""")
+
+        st.code("""
+        ada | 100
+        decarbonization | 65
+        wilting flowers
+        """)
+
         st.markdown("""
         _Note: The algorithm currently does not support searching for general terms. For example it will not search for chair or desk if you put furniture as a search term in your .txt file._
         """)      
@@ -538,17 +385,18 @@ def main():
 
         Here’s an example of how a row might look in the CSV file:
 
-        | sent_id | list_matchs          | found_words          | match_certainty | sentence                             | page_at_or_below |
-        |---------|----------------------|----------------------|-----------------|--------------------------------------|-------------------|
-        | 5       | red, blue  | red, rod, blue | 100            | Red rods are better than blue ones | 2                 |
-        | 24       | wilting flowers          | wilting, flowers           |             | She is a wilting flower.     | 3                 |
-        | 300       | flowers that bloom, red       | blowers, that, gloomy, red        |     100        | The red blowers are his that seem gloomy | 5             |
+        | sent_id | list_matchs          | found_words          | match_certainty | sentence                             | page_at_or_below | source |
+        |---------|----------------------|----------------------|-----------------|--------------------------------------|-------------------|--------|
+        | 5       | red, blue  | red, rod, blue | 100            | Red rods are better than blue ones | 2                 | document |
+        | 24       | wilting flowers          | wilting, flowers           |             | She is a wilting flower.     | 3                 | document |
+        | 300       | flowers that bloom, red       | blowers, that, gloomy, red        |     100        | The red blowers are his that seem gloomy | 5             | document |
+        | 312       | red       | red        |     100        | See the red report for details |              | footnotes |
 
         ### CSV Output Structure
-        The CSV file contains the following columns, which are used to track the matching process and its results. Here's what each header represents:
+        The CSV file contains the following columns, which are used to track the matching process and its results. The Excel and Parquet downloads have the same columns. Here's what each header represents:
 
         1. **`sent_id`**:
-        represents the **unique identifier** for each sentence or entry in the uploaded document. It is used to differentiate each sentence that is being processed and they are sequentially numbered according to the order in which they appear in the document.
+        represents the **unique identifier** for each sentence or entry in the uploaded document. It is used to differentiate each sentence that is being processed and they are sequentially numbered according to the order in which they appear in the document. The numbering continues through the headers, footers, footnotes, endnotes and comments after the main text.
 
         2. **`list_matchs`**:
         shows **the words/phrases in your uploaded word list** that have a match or similar match in the sentence.
@@ -557,13 +405,16 @@ def main():
         contains the **specific words or phrases** that were identified in the sentence **from your uploaded document** as a match or similar match to the words/phrases in your uploaded word list.
 
         4. **`match_certainty`**:
-        represents the **certainty level** of the match. It indicates how confident the system is that the words or phrases identified are correct matches. The value ranges from 0-100, with higher values indicating greater certainty. A value of 100 means there is an exact match. Phrases do not recieve a match certainty score.
+        represents the **certainty level** of the match. It indicates how confident the system is that the words or phrases identified are correct matches. The value ranges from 0-100, with higher values indicating greater certainty. A value of 100 means there is an exact match. Phrases do not recieve a match certainty score. The score is the edit distance based similarity of the two words (python-Levenshtein): twice the characters they share in order, divided by their combined length, so `onyo` and `yoyo` score 75. Earlier versions scored with Python's difflib, which gives some pairs a lower score (`onyo` and `yoyo` scored 50), so words close to a certainty threshold can now match where they did not before.
 
         5. **`sentence`**:
         shows the sentence from the text that was evaluated. It provides context for the identified matches and allows the user to search for the match sentence in the original document via keyboard shortcut `ctrl + f` or `cmd + f` in that docuemnt.
 
         6. **`page_at_or_below`**:
-        indicates the **page number** at or beyond the sentence was found in the orginal word .docx file. The sentence locating is somewhat imprecise, but the sentence **will not** appear before the listed page number for that sentence. The page locating will tend to become less accurate the deeper into your document you scroll due to word formatting limitations from tables and non-text components in a word document.
+        indicates the **page number** at or beyond the sentence was found in the orginal word .docx file. The sentence locating is somewhat imprecise, but the sentence **will not** appear before the listed page number for that sentence. The page locating will tend to become less accurate the deeper into your document you scroll due to word formatting limitations from tables and non-text components in a word document. It is left blank for sentences outside the main text.
+
+        7. **`source`**:
+        shows **where in the document** the sentence was found: `document` for the main text, `header1`, `footer1` and so on for the headers and footers, `footnotes`, `endnotes` or `comments`.
 
         ### How to Interpret the CSV Output:
         - The **`sent_id`** allows you and the system to track unique sentences in your document.
@@ -572,6 +423,7 @@ def main():
         - The **`match_certainty`** gives a confidence level on how accurate the match is.
         - The **`sentence`** column provides context, so you can understand where the matched words were found in the text.
         - The **`page_at_or_below`** helps track where in a document or series of pages the sentence is located, if you need to edit the sentence.
+        - The **`source`** tells you whether to look for the sentence in the main text, a header or footer, a note or a comment.
         """)
 
 # Run the main function
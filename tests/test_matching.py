@@ -0,0 +1,123 @@
+import copy
+import random
+
+import pytest
+from fuzzywuzzy import fuzz
+
+from wordfinder.cache import MemoryCache
+from wordfinder.matching import match_sentences, match_sentences_incremental
+from wordfinder.tokens import tokenize_sent, tokenize_word
+from wordfinder.word_list import compile_word_list
+
+VOCABULARY = ['energy', 'energies', 'enegry', 'program', 'programs', 'clean', 'cleaner', 'data', 'date', 'grid',
+              'grids', 'solar', 'polar', 'wind', 'winds', 'power', 'tower', 'the', 'and', 'a']
+WORD_LIST = ['energy', 'program | 90', 'clean energy', 'data', 'data', 'grid | 60', 'solar power', 'data data',
+             'wind', 'power', 'tower | 100', 'the grid', 'clean']
+WHITE_LIST = ['the', 'energies']
+
+def random_sentences(count, seed=0):
+    """Sentence units made of VOCABULARY words with some punctuation and capitals."""
+    rng = random.Random(seed)
+    sentence_list = []
+    for sent_id in range(1, count + 1):
+        words = [rng.choice(VOCABULARY) for _ in range(rng.randint(1, 12))]
+        words = [word.capitalize() if rng.random() < 0.1 else word for word in words]
+        words = [word + rng.choice(',;:') if rng.random() < 0.1 else word for word in words]
+        sentence_list.append({'sent_id': sent_id, 'sentence': ' '.join(words) + '.', 'page': 1, 'matches': []})
+    return sentence_list
+
+def brute_force_matches(sentence_list, word_list, white_list=(), sensitivity=75):
+    """
+    Score every sentence token against every token of every word list entry with fuzz.ratio, like the original
+    matcher. A phrase matches when all of its words are among the sentence tokens scoring over 75.
+    """
+    token_word_dict = tokenize_word(word_list)
+    for sent_item in sentence_list:
+        sent_tokens = tokenize_sent(sent_item['sentence'].lower())
+        qualified = set()
+        for sent_word in sent_tokens:
+            for word_phrase in token_word_dict:
+                for word in word_phrase['word_tokens']:
+                    word_ratio = fuzz.ratio(sent_word, word)
+                    if word_ratio > 75:
+                        qualified.add(sent_word)
+                    threshold = sensitivity if word_phrase['sensitivity'] is None else word_phrase['sensitivity']
+                    if word_phrase['phrase_type'] == 'single_word' and word_ratio >= threshold and sent_word not in white_list:
+                        sent_item['matches'].append({'match': word, 'ratio': word_ratio, 'found': sent_word})
+        for word_phrase in token_word_dict:
+            if word_phrase['phrase_type'] == 'multi_word' and all(word in qualified for word in word_phrase['word_tokens']):
+                sent_item['matches'].append({'match': word_phrase['word_orig'], 'ratio': None,
+                                             'found': list(dict.fromkeys(word_phrase['word_tokens']))})
+    return sentence_list
+
+@pytest.mark.parametrize('backend', ['fuzzywuzzy', 'numpy'])
+@pytest.mark.parametrize('sensitivity', [60, 75, 100])
+def test_fuzzy_matches_equal_brute_force(backend, sensitivity):
+    sentence_list = random_sentences(200)
+    expected = brute_force_matches(copy.deepcopy(sentence_list), WORD_LIST, WHITE_LIST, sensitivity)
+    match_sentences(sentence_list, compile_word_list(WORD_LIST, WHITE_LIST), backend=backend, sensitivity=sensitivity)
+    assert sentence_list == expected
+
+def revised_draft(sentence_list, seed=1):
+    """A copy of sentence_list with some sentences edited, dropped and added, renumbered from 1."""
+    rng = random.Random(seed)
+    draft = []
+    for sent_item in copy.deepcopy(sentence_list):
+        roll = rng.random()
+        if roll < 0.1:
+            continue
+        if roll < 0.2:
+            sent_item['sentence'] = sent_item['sentence'].replace('a', 'o')
+        draft.append(sent_item)
+        if roll > 0.9:
+            draft.extend(random_sentences(1, seed=rng.randrange(10**6)))
+    for sent_id, sent_item in enumerate(draft, 1):
+        sent_item['sent_id'] = sent_id
+        sent_item['matches'] = []
+    return draft
+
+def test_incremental_rescan_equals_full_rescan():
+    compiled = compile_word_list(WORD_LIST, WHITE_LIST)
+    sentence_cache = MemoryCache(max_items=10000)
+    first_draft = random_sentences(200)
+    assert match_sentences_incremental(first_draft, compiled, sentence_cache, 'key') == 0
+
+    second_draft = revised_draft(first_draft)
+    expected = copy.deepcopy(second_draft)
+    match_sentences(expected, compiled)
+    reused = match_sentences_incremental(second_draft, compiled, sentence_cache, 'key')
+    assert 0 < reused < len(second_draft)
+    assert second_draft == expected
+
+    # other matching options have their own cache key and reuse nothing
+    stricter = copy.deepcopy(second_draft)
+    for sent_item in stricter:
+        sent_item['matches'] = []
+    expected = copy.deepcopy(stricter)
+    match_sentences(expected, compiled, sensitivity=90)
+    assert match_sentences_incremental(stricter, compiled, sentence_cache, 'stricter', sensitivity=90) == 0
+    assert stricter == expected
+
+def contiguous_matches(sentence_list, word_list, white_list=()):
+    """Exact reference: single words equal to a sentence token, phrases whose words appear contiguously in order."""
+    token_word_dict = tokenize_word(word_list)
+    for sent_item in sentence_list:
+        sent_tokens = tokenize_sent(sent_item['sentence'].lower())
+        for sent_word in sent_tokens:
+            for word_phrase in token_word_dict:
+                if word_phrase['phrase_type'] == 'single_word' and word_phrase['word_tokens'] == [sent_word] and sent_word not in white_list:
+                    sent_item['matches'].append({'match': sent_word, 'ratio': 100, 'found': sent_word})
+        for word_phrase in token_word_dict:
+            size = len(word_phrase['word_tokens'])
+            if word_phrase['phrase_type'] == 'multi_word' and any(
+                    sent_tokens[start:start + size] == word_phrase['word_tokens'] for start in range(len(sent_tokens))):
+                sent_item['matches'].append({'match': word_phrase['word_orig'], 'ratio': None,
+                                             'found': list(dict.fromkeys(word_phrase['word_tokens']))})
+    return sentence_list
+
+def test_exact_matches_equal_contiguous_search():
+    sentence_list = random_sentences(500)
+    expected = contiguous_matches(copy.deepcopy(sentence_list), WORD_LIST, WHITE_LIST)
+    assert any(match['ratio'] is None for sent_item in expected for match in sent_item['matches'])
+    match_sentences(sentence_list, compile_word_list(WORD_LIST, WHITE_LIST), match_mode='exact')
+    assert sentence_list == expected
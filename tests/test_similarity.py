@@ -0,0 +1,10 @@
+import pytest
+
+from wordfinder.similarity import check_backend_parity, random_tokens
+
+SENT_TOKENS = random_tokens(300, seed=1) + ['energy', 'energies', 'program', 'onyo', 'x' * 80]
+LIST_TOKENS = random_tokens(200, seed=2) + ['energy', 'programs', 'yoyo', 'x' * 70, '']
+
+@pytest.mark.parametrize('score_cutoff', [0, 75])
+def test_numpy_backend_matches_fuzz_ratio(score_cutoff):
+    assert check_backend_parity(SENT_TOKENS, LIST_TOKENS, backends=['numpy'], score_cutoff=score_cutoff) == []
@@ -0,0 +1 @@
+"""Processing engine behind the Word Finder streamlit app."""
@@ -0,0 +1,320 @@
+"""
+Benchmark harness for the scan pipeline.
+
+    python -m wordfinder.benchmark run [--preset quick|standard|full] [--output results.json] [--baseline saved.json]
+    python -m wordfinder.benchmark compare saved.json results.json
+    python -m wordfinder.benchmark startup [--repeat 5] [--output startup.json] [--baseline saved_startup.json]
+
+Synthetic DOCX files (1 to 500 pages with tables, page breaks and long paragraphs) are paired with synthetic word
+lists (10 to 5,000 entries mixing single words and phrases). Each case runs through scan_document like a real scan,
+so every ScanMetrics stage from unzipping the DOCX through collapsing and exporting the matches is timed under the
+name the app and the CLI report, and the peak traced memory of each case is recorded. Results are stored as JSON
+so a later run can be compared against a saved baseline; stages that got slower or hungrier are flagged.
+The startup benchmark times cold starts in fresh interpreters: importing the streamlit page, rendering it for
+the first time and loading and warming the processing engine on first use.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tracemalloc
+import zipfile
+from datetime import datetime, timezone
+
+from wordfinder.engine import scan_document
+from wordfinder.export import table_bytes
+from wordfinder.metrics import STAGES, ScanMetrics
+from wordfinder.similarity import DEFAULT_BACKEND
+from wordfinder.word_list import compile_word_list
+
+# (pages, word list entries) cases of each preset
+PRESETS = {
+    'quick': [(1, 10), (10, 100), (20, 500)],
+    'standard': [(1, 10), (20, 100), (100, 500), (100, 2000)],
+    'full': [(1, 10), (20, 100), (100, 500), (250, 2000), (500, 5000)],
+}
+PARAGRAPHS_PER_PAGE = 12
+REGRESSION_RATIO = 0.2 # a stage is flagged when it got more than 20% slower or hungrier
+MIN_REGRESSION_SECONDS = 0.05 # ...and by more than this, so tiny stages do not flag on timer noise
+
+WORD_NAMESPACE_URI = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+SYLLABLES = ['ba', 'ce', 'di', 'fo', 'gu', 'ha', 'je', 'ki', 'lo', 'mu', 'na', 'pe', 'ri', 'so', 'tu', 'va',
+             'we', 'xi', 'yo', 'ze', 'an', 'er', 'in', 'on', 'st', 'tr', 'ch', 'sh']
+
+#FUNCTIONS TO GENERATE THE INPUTS-------------------------------------
+def synthetic_vocabulary(size=8000, seed=0):
+    """Distinct made up words of 1 to 5 syllables; earlier words are drawn more often when writing text."""
+    rng = random.Random(seed)
+    words = dict.fromkeys(['the', 'and', 'of', 'to', 'in', 'energy', 'program', 'report'])
+    while len(words) < size:
+        words[''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 5)))] = None
+    return list(words)
+
+def synthetic_sentence(rng, vocabulary, length):
+    words = [vocabulary[min(int(rng.paretovariate(1.2)) - 1, len(vocabulary) - 1)] for _ in range(length)]
+    words[0] = words[0].capitalize()
+    if rng.random() < 0.1:
+        words.insert(rng.randrange(len(words)), f'{rng.randint(1, 99)}.{rng.randint(0, 9)}')
+    return ' '.join(words) + rng.choice(['.', '.', '.', '?', '!'])
+
+def synthetic_paragraph(rng, vocabulary, page_break=False):
+    """One w:p; about one in twenty is a long paragraph of 150 to 400 words, split over several runs."""
+    sentence_count = rng.randint(8, 20) if rng.random() < 0.05 else rng.randint(1, 4)
+    text = ' '.join(synthetic_sentence(rng, vocabulary, rng.randint(3, 25)) for _ in range(sentence_count))
+    cuts = sorted(rng.sample(range(1, len(text)), min(2, len(text) - 1)))
+    runs = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+    xml = ['<w:p>']
+    if page_break:
+        xml.append('<w:r><w:lastRenderedPageBreak/></w:r>')
+    for run in runs:
+        xml.append(f'<w:r><w:t xml:space="preserve">{run}</w:t></w:r>')
+    xml.append('</w:p>')
+    return ''.join(xml)
+
+def synthetic_table(rng, vocabulary, rows=3, cols=3):
+    cells = ''.join(
+        '<w:tr>' + ''.join(f'<w:tc>{synthetic_paragraph(rng, vocabulary)}</w:tc>' for _ in range(cols)) + '</w:tr>'
+        for _ in range(rows)
+    )
+    return f'<w:tbl>{cells}</w:tbl>'
+
+def synthetic_docx(pages, seed=0, vocabulary=None):
+    """Bytes of a DOCX with about PARAGRAPHS_PER_PAGE paragraphs per page, a table every third page and page breaks."""
+    rng = random.Random(seed)
+    vocabulary = vocabulary or synthetic_vocabulary(seed=seed)
+    body = []
+    for page in range(pages):
+        if page % 3 == 2:
+            body.append(synthetic_table(rng, vocabulary))
+        for paragraph in range(PARAGRAPHS_PER_PAGE):
+            body.append(synthetic_paragraph(rng, vocabulary, page_break=page > 0 and paragraph == 0))
+        body.append('<w:p><w:r><w:br w:type="page"/></w:r></w:p>')
+    document = (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document xmlns:w="{WORD_NAMESPACE_URI}">'
+                f'<w:body>{"".join(body)}<w:sectPr/></w:body></w:document>')
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr('[Content_Types].xml', '<?xml version="1.0" encoding="UTF-8"?><Types/>')
+        docx.writestr('word/document.xml', document)
+        docx.writestr('word/media/image1.png', bytes(rng.getrandbits(8) for _ in range(4096)))
+    return buffer.getvalue()
+
+def misspell(rng, word):
+    position = rng.randrange(len(word))
+    return word[:position] + rng.choice('aeiourst') + word[position + 1:]
+
+def synthetic_word_list(entries, seed=0, vocabulary=None, phrase_share=0.3):
+    """Lowercased word list lines: words from the vocabulary, misspelled words and 2 to 3 word phrases."""
+    rng = random.Random(seed + 1)
+    vocabulary = vocabulary or synthetic_vocabulary(seed=seed)
+    word_list = []
+    for _ in range(entries):
+        if rng.random() < phrase_share:
+            word_list.append(' '.join(rng.choice(vocabulary[:2000]) for _ in range(rng.randint(2, 3))))
+        elif rng.random() < 0.3:
+            word_list.append(misspell(rng, rng.choice(vocabulary[:3000])))
+        else:
+            word_list.append(rng.choice(vocabulary[:3000]))
+    return word_list
+
+#FUNCTIONS TO MEASURE THE PIPELINE-------------------------------------
+def run_pipeline(docx_data, word_list, backend=DEFAULT_BACKEND, workers=1):
+    """Scan once and return (ScanMetrics, sentence count, match count)."""
+    metrics = ScanMetrics(backend=backend, workers=workers)
+    with metrics.stage('word_list') as stage:
+        compiled = compile_word_list(word_list)
+        stage.count(list_terms=len(compiled.token_word_dict), list_tokens=len(compiled.list_vocab))
+    sentence_list, collapsed_df = scan_document(io.BytesIO(docx_data), compiled, backend=backend, workers=workers, metrics=metrics)
+    with metrics.stage('export') as stage:
+        if not collapsed_df.empty:
+            stage.count(bytes=len(table_bytes(collapsed_df, 'csv')))
+    return metrics, len(sentence_list), sum(len(sent_item['matches']) for sent_item in sentence_list)
+
+def run_case(pages, entries, seed=0, backend=DEFAULT_BACKEND, workers=1, measure_memory=True):
+    """Benchmark one (pages, entries) case; memory is traced in a second run so tracing does not skew the timings."""
+    vocabulary = synthetic_vocabulary(seed=seed)
+    docx_data = synthetic_docx(pages, seed, vocabulary)
+    word_list = synthetic_word_list(entries, seed, vocabulary)
+    metrics, sentence_count, match_count = run_pipeline(docx_data, word_list, backend, workers)
+    case = {
+        'name': f'{pages}p_{entries}w',
+        'pages': pages,
+        'entries': entries,
+        'docx_bytes': len(docx_data),
+        'sentences': sentence_count,
+        'matches': match_count,
+        'stages': {name: stage['wall_seconds'] for name, stage in metrics.to_dict()['stages'].items()},
+        'total': round(metrics.total_seconds(), 4),
+        'peak_mb': None,
+    }
+    if measure_memory:
+        tracemalloc.start()
+        run_pipeline(docx_data, word_list, backend, workers)
+        case['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        tracemalloc.stop()
+    return case
+
+def run_suite(cases, backend=DEFAULT_BACKEND, workers=1, measure_memory=True, log=None):
+    """Run every (pages, entries) case and return the results document stored as JSON."""
+    results = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'backend': backend,
+        'workers': workers,
+        'cases': [],
+    }
+    for pages, entries in cases:
+        case = run_case(pages, entries, backend=backend, workers=workers, measure_memory=measure_memory)
+        results['cases'].append(case)
+        if log:
+            log(f"{case['name']}: {case['sentences']} sentences, {case['matches']} matches, "
+                f"{case['total']:.2f}s, peak {case['peak_mb']} MB")
+    return results
+
+def compare_results(baseline, current, ratio=REGRESSION_RATIO, min_seconds=MIN_REGRESSION_SECONDS):
+    """
+    Compare two results documents case by case.
+    Returns (report lines, regressions) where regressions lists the (case, metric, before, after) that got worse
+    by more than ratio (and, for timings, by more than min_seconds).
+    """
+    baseline_cases = {case['name']: case for case in baseline['cases']}
+    lines = [f"{'case':<14}{'metric':<14}{'baseline':>10}{'current':>10}{'change':>9}"]
+    regressions = []
+    for case in current['cases']:
+        before_case = baseline_cases.get(case['name'])
+        if before_case is None:
+            lines.append(f"{case['name']:<14}not in baseline")
+            continue
+        metrics = [(stage, before_case['stages'].get(stage), case['stages'].get(stage), min_seconds) for stage in STAGES]
+        metrics.append(('total', before_case['total'], case['total'], min_seconds))
+        metrics.append(('peak_mb', before_case.get('peak_mb'), case.get('peak_mb'), 0))
+        for metric, before, after, min_change in metrics:
+            if before is None or after is None:
+                continue
+            change = (after - before) / before if before else 0.0
+            flag = change > ratio and after - before > min_change
+            if flag:
+                regressions.append((case['name'], metric, before, after))
+            lines.append(f"{case['name']:<14}{metric:<14}{before:>10.3f}{after:>10.3f}{change:>+9.0%}{'  REGRESSION' if flag else ''}")
+    return lines, regressions
+
+#FUNCTIONS TO MEASURE THE STARTUP-------------------------------------
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_SCRIPT = 'sent_search_streamlit.py'
+# measurement: python code run in a fresh interpreter in APP_DIR that prints the seconds it measured
+STARTUP_MEASUREMENTS = {
+    'import_streamlit': (
+        "import time; started = time.perf_counter(); import streamlit; print(time.perf_counter() - started)"),
+    'import_page': (
+        "import streamlit, time; started = time.perf_counter(); import sent_search_streamlit; print(time.perf_counter() - started)"),
+    'first_render': (
+        "import time; started = time.perf_counter(); from streamlit.testing.v1 import AppTest; "
+        f"AppTest.from_file({APP_SCRIPT!r}, default_timeout=60).run(); print(time.perf_counter() - started)"),
+    'engine_load': (
+        "import time; started = time.perf_counter(); from wordfinder.engine import warm_up; warm_up(); "
+        "print(time.perf_counter() - started)"),
+}
+
+def measure_startup(name, repeat=5):
+    """Median seconds of one STARTUP_MEASUREMENTS entry over repeat fresh interpreters."""
+    env = dict(os.environ, STREAMLIT_LOGGER_LEVEL='error', PYTHONWARNINGS='ignore')
+    samples = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, '-c', STARTUP_MEASUREMENTS[name]], cwd=APP_DIR, env=env,
+                                   capture_output=True, text=True, check=True)
+        samples.append(float(completed.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+def run_startup(repeat=5, log=None):
+    """Time every startup measurement and return the results document stored as JSON."""
+    results = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'startup': {},
+    }
+    for name in STARTUP_MEASUREMENTS:
+        results['startup'][name] = round(measure_startup(name, repeat), 4)
+        if log:
+            log(f"{name}: {results['startup'][name]:.3f}s")
+    return results
+
+def compare_startup(baseline, current, ratio=REGRESSION_RATIO, min_seconds=MIN_REGRESSION_SECONDS):
+    """compare_results for two startup results documents."""
+    lines = [f"{'measurement':<18}{'baseline':>10}{'current':>10}{'change':>9}"]
+    regressions = []
+    for name, after in current['startup'].items():
+        before = baseline['startup'].get(name)
+        if before is None:
+            lines.append(f"{name:<18}not in baseline")
+            continue
+        change = (after - before) / before if before else 0.0
+        flag = change > ratio and after - before > min_seconds
+        if flag:
+            regressions.append(('startup', name, before, after))
+        lines.append(f"{name:<18}{before:>10.3f}{after:>10.3f}{change:>+9.0%}{'  REGRESSION' if flag else ''}")
+    return lines, regressions
+
+#COMMAND LINE-------------------------------------
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m wordfinder.benchmark', description='Benchmark the Word Finder scan pipeline.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='run the benchmark suite')
+    run.add_argument('--preset', default='quick', choices=sorted(PRESETS), help='cases to run (default: quick)')
+    run.add_argument('--case', action='append', metavar='PAGES:ENTRIES', help='run this case instead of a preset, e.g. 500:5000')
+    run.add_argument('--output', default='benchmark_results.json', help='JSON file for the results (default: benchmark_results.json)')
+    run.add_argument('--baseline', help='saved results to compare against')
+    run.add_argument('--backend', default=DEFAULT_BACKEND, help='similarity backend')
+    run.add_argument('--workers', type=int, default=1, help='matching worker processes (default: 1)')
+    run.add_argument('--no-memory', action='store_true', help='skip the traced run that records peak memory')
+    compare = commands.add_parser('compare', help='compare two saved results')
+    compare.add_argument('baseline', help='saved baseline results')
+    compare.add_argument('current', help='results to check')
+    startup = commands.add_parser('startup', help='time cold starts of the streamlit page and the engine')
+    startup.add_argument('--repeat', type=int, default=5, help='fresh interpreters per measurement, the median is kept (default: 5)')
+    startup.add_argument('--output', default='startup_results.json', help='JSON file for the results (default: startup_results.json)')
+    startup.add_argument('--baseline', help='saved startup results to compare against')
+    for command in (run, compare, startup):
+        command.add_argument('--threshold', type=float, default=REGRESSION_RATIO, help='relative slowdown flagged as a regression (default: 0.2)')
+    return parser
+
+def load_results(path):
+    with open(path) as file:
+        return json.load(file)
+
+def report(baseline, current, threshold):
+    compare = compare_startup if 'startup' in current else compare_results
+    lines, regressions = compare(baseline, current, ratio=threshold)
+    print('\n'.join(lines))
+    print(f'{len(regressions)} regression(s) against the baseline')
+    return 1 if regressions else 0
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'compare':
+        return report(load_results(args.baseline), load_results(args.current), args.threshold)
+
+    log = lambda line: print(line, file=sys.stderr)
+    if args.command == 'startup':
+        results = run_startup(args.repeat, log=log)
+    else:
+        cases = [tuple(int(part) for part in case.split(':')) for case in args.case] if args.case else PRESETS[args.preset]
+        results = run_suite(cases, backend=args.backend, workers=args.workers, measure_memory=not args.no_memory, log=log)
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f'results written to {args.output}', file=sys.stderr)
+    if args.baseline:
+        return report(load_results(args.baseline), results, args.threshold)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Resource budgets for scanning untrusted uploads on a shared server.
+A ScanBudget caps the decompressed XML size, the sentence count, the token x term pairs handed to the scorer and
+the wall time of one scan. The first cap that is hit raises BudgetExceeded with a message meant for the user, and
+nothing has been written to disk by then, so there is nothing to clean up. Set a cap to 0 to turn it off.
+"""
+import os
+import threading
+import time
+
+MAX_XML_MB = float(os.environ.get('WORDFINDER_MAX_XML_MB', 100)) # decompressed size of the text parts together
+MAX_SENTENCES = int(os.environ.get('WORDFINDER_MAX_SENTENCES', 200000)) # sentences in one document
+MAX_PAIRS = int(os.environ.get('WORDFINDER_MAX_PAIRS', 200000000)) # distinct document tokens x word list tokens
+MAX_SECONDS = float(os.environ.get('WORDFINDER_MAX_SECONDS', 600)) # wall time of one scan
+
+class UploadRejected(Exception):
+    """An upload that cannot be scanned; the message is shown to the user as is."""
+
+class BudgetExceeded(UploadRejected):
+    """Raised as soon as a scan goes over one of its ScanBudget caps."""
+
+class ScanBudget:
+    """Caps of one scan, its clock starting when the budget is created."""
+
+    def __init__(self, max_xml_mb=MAX_XML_MB, max_sentences=MAX_SENTENCES, max_pairs=MAX_PAIRS, max_seconds=MAX_SECONDS):
+        self.max_xml_bytes = int(max_xml_mb * 2**20)
+        self.max_sentences = max_sentences
+        self.max_pairs = max_pairs
+        self.max_seconds = max_seconds
+        self.deadline = time.monotonic() + max_seconds if max_seconds else None
+        self.xml_bytes = 0 # inflated so far, over every part being read
+        self.lock = threading.Lock()
+
+    def check_xml_bytes(self, xml_bytes):
+        if self.max_xml_bytes and xml_bytes > self.max_xml_bytes:
+            raise BudgetExceeded(f"The document's text is larger than the {self.max_xml_bytes / 2**20:g} MB this server accepts. "
+                                 "Please split it into smaller documents.")
+
+    def add_xml_bytes(self, xml_bytes):
+        """Count bytes inflated by any reading thread against the XML size cap."""
+        with self.lock:
+            self.xml_bytes += xml_bytes
+            total = self.xml_bytes
+        self.check_xml_bytes(total)
+
+    def check_sentences(self, sentence_count):
+        if self.max_sentences and sentence_count > self.max_sentences:
+            raise BudgetExceeded(f"The document has {sentence_count} sentences, more than the {self.max_sentences} this server accepts. "
+                                 "Please split it into smaller documents.")
+
+    def check_pairs(self, pair_count):
+        if self.max_pairs and pair_count > self.max_pairs:
+            raise BudgetExceeded(f"Comparing this document with this word list takes {pair_count} word comparisons, more than the "
+                                 f"{self.max_pairs} this server allows. Please use a shorter word list, a smaller document or exact matching.")
+
+    def check_time(self):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise BudgetExceeded(f"Processing took longer than the {self.max_seconds:g} seconds this server allows. "
+                                 "Please use a shorter word list, a smaller document or exact matching.")
+
+    def guard(self, progress_callback=None):
+        """progress_callback(stage, count, total) that first checks the wall time, so long stages stop in time."""
+        def report(stage, count, total):
+            self.check_time()
+            if progress_callback:
+                progress_callback(stage, count, total)
+        return report
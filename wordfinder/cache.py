@@ -0,0 +1,132 @@
+"""
+Small two level caches keyed by content hashes: a bounded in-process LRU backed by a size capped pickle store on
+local disk. Disk failures never break a scan, the cache just falls back to memory only. Loading a pickle can run
+code, so a disk folder is only used when it belongs to the current user and nobody else can open it.
+"""
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+import threading
+from collections import OrderedDict
+
+CACHE_DIR = os.environ.get('WORDFINDER_CACHE_DIR',
+                           os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache')), 'wordfinder'))
+CACHE_MB = int(os.environ.get('WORDFINDER_CACHE_MB', 256)) # disk cap for each cache folder
+
+def content_hash(*parts):
+    """sha256 hex digest over the given bytes/str parts, with a separator so part boundaries matter."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+    return digest.hexdigest()
+
+class MemoryCache:
+    """Least recently used mapping holding at most max_items values, safe to share between threads."""
+
+    def __init__(self, max_items=16):
+        self.max_items = max_items
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.items:
+                return None
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_items:
+                self.items.popitem(last=False)
+
+class DiskCache:
+    """
+    Pickle files in one folder, evicted least recently used first once they add up to more than max_bytes.
+    File modification times record the last use. The folder is created with mode 0700 and neither read nor written
+    when it is not a folder of the current user with mode 0700.
+    """
+
+    def __init__(self, directory, max_bytes=CACHE_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.pkl')
+
+    def private(self):
+        """True when the folder belongs to the current user and only they can use it."""
+        try:
+            folder = os.stat(self.directory)
+        except OSError:
+            return False
+        if not stat.S_ISDIR(folder.st_mode):
+            return False
+        if not hasattr(os, 'getuid'):
+            # no POSIX owners or modes to check, e.g. on Windows
+            return True
+        return folder.st_uid == os.getuid() and stat.S_IMODE(folder.st_mode) == 0o700
+
+    def get(self, key):
+        if not self.private():
+            return None
+        try:
+            with open(self.path(key), 'rb') as file:
+                value = pickle.load(file)
+            os.utime(self.path(key))
+            return value
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+
+    def put(self, key, value):
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            if not self.private():
+                return
+            # write to a temp file first so a reader never sees half an entry
+            with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as file:
+                pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(file.name, self.path(key))
+            self.evict()
+        except OSError:
+            pass
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pkl'):
+                file_stat = os.stat(os.path.join(self.directory, name))
+                entries.append((file_stat.st_mtime, file_stat.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+class TieredCache:
+    """Memory first, then disk; disk hits are promoted back into memory."""
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        return value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
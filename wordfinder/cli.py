@@ -0,0 +1,162 @@
+"""
+Command line batch scanner.
+
+    python -m wordfinder --word-list words.txt [--whitelist exclude.txt] [--output-dir out | --combined all.csv] docs/
+    python -m wordfinder --index library.sqlite --word-list words.txt [docs/]
+
+Every DOCX file (or every DOCX file in a given folder) is scanned against one compiled word list and written
+either to its own file in the output folder or to a single combined file with a document column, as CSV
+(default), Parquet or XLSX. --metrics adds a JSON file with the timings and counts of every stage next to each
+output file and --profile writes a cProfile dump of the whole run.
+With --index the documents are first ingested into a corpus index (unchanged ones are skipped) and the word list
+is then run against every document in the index, without reading any DOCX file again.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+import pandas as pd
+
+from wordfinder.corpus import CorpusIndex
+from wordfinder.engine import find_docx_files, scan_documents
+from wordfinder.export import EXPORT_FORMATS, write_table
+from wordfinder.matching import MATCH_MODES, SENSITIVITY
+from wordfinder.metrics import profile_to
+from wordfinder.similarity import DEFAULT_BACKEND, SIMILARITY_BACKENDS
+from wordfinder.word_list import cached_compile_word_list
+
+def certainty(value):
+    """argparse type for a match certainty between 1 and 100."""
+    try:
+        score = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a whole number")
+    if not 1 <= score <= 100:
+        raise argparse.ArgumentTypeError(f'{score} is not between 1 and 100')
+    return score
+
+def at_least(minimum):
+    """argparse type for a whole number of at least minimum."""
+    def whole_number(value):
+        try:
+            number = int(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"'{value}' is not a whole number")
+        if number < minimum:
+            raise argparse.ArgumentTypeError(f'{number} is less than {minimum}')
+        return number
+    return whole_number
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m wordfinder', description='Scan DOCX files for the words and phrases on a word list.')
+    parser.add_argument('documents', nargs='*', help='DOCX files or folders holding DOCX files')
+    parser.add_argument('--index', help='SQLite corpus index to add the documents to and to run the word list against')
+    parser.add_argument('--word-list', required=True, help='TXT file with one word or phrase per line')
+    parser.add_argument('--whitelist', help='TXT file with one excluded word per line')
+    parser.add_argument('--output-dir', default='.', help='folder for the per document files (default: current folder)')
+    parser.add_argument('--combined', help='write one combined file with a document column to this path instead')
+    parser.add_argument('--format', default='csv', choices=sorted(EXPORT_FORMATS), help='output file format (default: csv)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='documents scanned at once (default: CPU count)')
+    parser.add_argument('--backend', default=DEFAULT_BACKEND, choices=sorted(SIMILARITY_BACKENDS),
+                        help='similarity backend; numpy only gives the same scores as fuzzywuzzy with python-Levenshtein installed')
+    parser.add_argument('--phrase-gap', type=at_least(0), help='only match phrases whose words appear in order with at most this many words between them')
+    parser.add_argument('--match-mode', default='fuzzy', choices=MATCH_MODES,
+                        help='fuzzy: score every word (default); exact_first: skip scoring words that are on the list as is; '
+                             'exact: exact words and contiguous phrases only')
+    parser.add_argument('--sensitivity', type=certainty, default=SENSITIVITY,
+                        help=f'lowest match certainty (1-100) for words without their own "| 90" threshold (default: {SENSITIVITY})')
+    parser.add_argument('--top-k', type=at_least(1), help='only report the best TOP_K list words for each word of a document')
+    parser.add_argument('--metrics', action='store_true', help='write per stage timings and counts as JSON next to the output and log them')
+    parser.add_argument('--profile', metavar='FILE', help='write a cProfile dump of the run to FILE (documents scanned by workers are not included)')
+    return parser
+
+def print_progress(stage, count, total):
+    print(f'[{count}/{total}] documents scanned', file=sys.stderr)
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.metrics:
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+    with profile_to(args.profile):
+        return run(args)
+
+def run(args):
+    docx_paths = find_docx_files(args.documents)
+    if not docx_paths and not args.index:
+        print('No DOCX files found.', file=sys.stderr)
+        return 1
+
+    with open(args.word_list, 'rb') as file:
+        word_data = file.read()
+    white_data = b''
+    if args.whitelist:
+        with open(args.whitelist, 'rb') as file:
+            white_data = file.read()
+    compiled = cached_compile_word_list(word_data, white_data)
+
+    if args.index:
+        with CorpusIndex(args.index) as index:
+            failed = 0
+            for docx_path, ingested, error in index.ingest_many(docx_paths):
+                if error is not None:
+                    failed += 1
+                    print(f'{os.path.basename(docx_path)}: failed ({error})', file=sys.stderr)
+                elif ingested:
+                    print(f'{os.path.basename(docx_path)}: added to the index', file=sys.stderr)
+            results = index.query(compiled, workers=args.workers, backend=args.backend, phrase_gap=args.phrase_gap,
+                                  match_mode=args.match_mode, sensitivity=args.sensitivity, top_k=args.top_k)
+            status = write_results(args, index.documents(), results)
+        return 1 if failed else status
+    results = scan_documents(docx_paths, compiled, workers=args.workers, backend=args.backend, phrase_gap=args.phrase_gap,
+                             match_mode=args.match_mode, sensitivity=args.sensitivity, top_k=args.top_k,
+                             progress_callback=print_progress)
+    return write_results(args, docx_paths, results)
+
+def write_results(args, docx_paths, results):
+    """Write the (docx_path, collapsed_df, metrics, error) results; returns 1 when any document failed, else 0."""
+    if not args.combined:
+        os.makedirs(args.output_dir, exist_ok=True)
+    combined = {}
+    combined_metrics = {}
+    failed = 0
+    for docx_path, collapsed_df, metrics, error in results:
+        name = os.path.basename(docx_path)
+        if error is not None:
+            failed += 1
+            print(f'{name}: failed ({error})', file=sys.stderr)
+            continue
+        print(f'{name}: {len(collapsed_df)} matched sentences', file=sys.stderr)
+        stem = os.path.splitext(name)[0]
+        if args.combined:
+            combined[docx_path] = collapsed_df
+            combined_metrics[name] = metrics
+            continue
+        if not collapsed_df.empty:
+            output_path = os.path.join(args.output_dir, f'{stem}_wordfinder_matches{EXPORT_FORMATS[args.format][0]}')
+            with metrics.stage('export') as stage:
+                write_table(collapsed_df, output_path, args.format)
+            stage.count(bytes=os.path.getsize(output_path))
+        if args.metrics:
+            metrics.log()
+            with open(os.path.join(args.output_dir, f'{stem}_wordfinder_metrics.json'), 'w', encoding='utf-8') as file:
+                file.write(metrics.to_json())
+
+    if args.combined:
+        # keep the input order of the documents regardless of the order they finished in
+        frames = [combined[docx_path].assign(document=os.path.basename(docx_path))
+                  for docx_path in docx_paths if docx_path in combined and not combined[docx_path].empty]
+        combined_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        if not combined_df.empty:
+            combined_df = combined_df[['document'] + [column for column in combined_df.columns if column != 'document']]
+        write_table(combined_df, args.combined, args.format)
+        if args.metrics:
+            for metrics in combined_metrics.values():
+                metrics.log()
+            with open(f'{os.path.splitext(args.combined)[0]}_metrics.json', 'w', encoding='utf-8') as file:
+                json.dump({name: metrics.to_dict() for name, metrics in combined_metrics.items()}, file, indent=2, default=str)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
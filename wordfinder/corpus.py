@@ -0,0 +1,172 @@
+"""
+Persistent corpus index, so a new word list can be run against a library of documents without reading them again.
+Ingesting a DOCX file stores its sentences and pages in a local SQLite file together with a corpus wide token
+vocabulary and an inverted index from token to sentence. A word list query scores the corpus vocabulary once,
+pulls only the sentences holding a token with a hit and matches those; every other sentence has no matches.
+"""
+import io
+import os
+import sqlite3
+from collections import defaultdict
+
+from wordfinder.cache import content_hash
+from wordfinder.engine import read_sentences
+from wordfinder.export import collapse_sentence_data
+from wordfinder.matching import SENSITIVITY, list_token_cutoffs, match_sentences, score_vocabulary
+from wordfinder.metrics import ScanMetrics
+from wordfinder.similarity import DEFAULT_BACKEND
+from wordfinder.tokens import tokenize_sent
+
+# bump when the stored sentences or tokens change, e.g. a new segmentation or tokenizer
+INDEX_VERSION = '2'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, content_hash TEXT NOT NULL, sentence_count INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS sentences (
+    doc_id INTEGER NOT NULL, sent_id INTEGER NOT NULL, page INTEGER, sentence TEXT NOT NULL, source TEXT NOT NULL,
+    PRIMARY KEY (doc_id, sent_id)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tokens (token_id INTEGER PRIMARY KEY, token TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS postings (
+    token_id INTEGER NOT NULL, doc_id INTEGER NOT NULL, sent_id INTEGER NOT NULL,
+    PRIMARY KEY (token_id, doc_id, sent_id)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+"""
+
+class CorpusIndex:
+    """
+    SQLite index of ingested DOCX files at path, created when missing. Documents are keyed by their absolute path
+    and re-ingested only when their content changes. Use as a context manager or call close().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.token_ids = None # {token: token_id} of the tokens table, loaded on the first ingest
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None:
+            with self.connection:
+                self.connection.execute("INSERT INTO meta VALUES ('version', ?)", (INDEX_VERSION,))
+        elif row[0] != INDEX_VERSION:
+            self.connection.close()
+            raise ValueError(f"The corpus index {path} was built by another version of the Word Finder, delete it and ingest again.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def documents(self):
+        """Paths of the ingested documents in ingestion order."""
+        return [path for path, in self.connection.execute("SELECT path FROM documents ORDER BY doc_id")]
+
+    def ingest(self, docx_path):
+        """Read one DOCX file into the index unless it is already there unchanged. Returns True when it was (re)read."""
+        path = os.path.abspath(docx_path)
+        with open(path, 'rb') as file:
+            docx_data = file.read()
+        docx_hash = content_hash(docx_data)
+        row = self.connection.execute("SELECT doc_id, content_hash FROM documents WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[1] == docx_hash:
+            return False
+        sentence_list = read_sentences(io.BytesIO(docx_data))
+
+        if self.token_ids is None:
+            self.token_ids = dict(self.connection.execute("SELECT token, token_id FROM tokens"))
+        token_ids = self.token_ids
+        new_ids = {}
+        postings = []
+        with self.connection:
+            if row is not None:
+                self.remove(row[0])
+            doc_id = self.connection.execute("INSERT INTO documents (path, content_hash, sentence_count) VALUES (?, ?, ?)",
+                                             (path, docx_hash, len(sentence_list))).lastrowid
+            self.connection.executemany("INSERT INTO sentences VALUES (?, ?, ?, ?, ?)",
+                                        ((doc_id, sent_item['sent_id'], sent_item['page'], sent_item['sentence'], sent_item['source'])
+                                         for sent_item in sentence_list))
+            # the same lowercased tokens intern_sentences gives the matcher
+            for sent_item in sentence_list:
+                for sent_word in set(tokenize_sent(sent_item['sentence'].lower())):
+                    token_id = token_ids.get(sent_word) or new_ids.get(sent_word)
+                    if token_id is None:
+                        token_id = new_ids[sent_word] = len(token_ids) + len(new_ids) + 1
+                    postings.append((token_id, doc_id, sent_item['sent_id']))
+            self.connection.executemany("INSERT INTO tokens VALUES (?, ?)", ((token_id, token) for token, token_id in new_ids.items()))
+            self.connection.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+        # only once the transaction is committed, so a failed ingest leaves no tokens the table does not have
+        token_ids.update(new_ids)
+        return True
+
+    def remove(self, doc_id):
+        """Drop a document's rows; its tokens stay in the vocabulary for the next documents."""
+        for table in ('postings', 'sentences', 'documents'):
+            self.connection.execute(f"DELETE FROM {table} WHERE doc_id = ?", (doc_id,))
+
+    def ingest_many(self, docx_paths, progress_callback=None):
+        """
+        ingest every path, yielding (docx_path, ingested, error) as each finishes; ingested is False for a document
+        already in the index unchanged and error is the raised exception for one that could not be read.
+        progress_callback(stage, count, total) is called with stage 'ingest' after each document.
+        """
+        for count, docx_path in enumerate(docx_paths, 1):
+            try:
+                result = (docx_path, self.ingest(docx_path), None)
+            except Exception as error:
+                result = (docx_path, False, error)
+            if progress_callback:
+                progress_callback('ingest', count, len(docx_paths))
+            yield result
+
+    def query(self, compiled, backend=DEFAULT_BACKEND, workers=1, phrase_gap=None, match_mode='fuzzy', sensitivity=SENSITIVITY,
+              top_k=None, progress_callback=None):
+        """
+        Run a CompiledWordList against every ingested document, with the same results as scan_documents.
+        Yields (docx_path, collapsed_df, metrics, None) per document in ingestion order, the same tuples as
+        scan_documents. The corpus vocabulary is scored once, spread over workers processes; progress_callback is
+        handed to score_vocabulary as stage 'single'.
+        """
+        def report(count, total):
+            if progress_callback:
+                progress_callback('single', count, total)
+
+        corpus_tokens = dict(self.connection.execute(
+            "SELECT token_id, token FROM tokens WHERE token_id IN (SELECT DISTINCT token_id FROM postings)"))
+        vocab_scores = None
+        if match_mode == 'exact':
+            list_tokens = set(compiled.list_vocab)
+            hit_ids = [token_id for token_id, token in corpus_tokens.items() if token in list_tokens]
+        else:
+            exact_ids = set()
+            if match_mode == 'exact_first':
+                exact_ids = {token_id for token_id, token in corpus_tokens.items()
+                             if compiled.vocabulary.get(token) in compiled.single_positions}
+            fuzzy_vocab = [token for token_id, token in corpus_tokens.items() if token_id not in exact_ids]
+            vocab_scores = score_vocabulary(fuzzy_vocab, compiled.word_index, list_token_cutoffs(compiled, sensitivity), backend,
+                                            workers=workers, progress_callback=report)
+            hit_ids = list(exact_ids) + [token_id for token_id, token in corpus_tokens.items() if vocab_scores.get(token)]
+
+        # every sentence holding a token with a hit, grouped by document
+        self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS hit_tokens (token_id INTEGER PRIMARY KEY)")
+        self.connection.execute("DELETE FROM hit_tokens")
+        self.connection.executemany("INSERT INTO hit_tokens VALUES (?)", ((token_id,) for token_id in hit_ids))
+        doc_sentences = defaultdict(list)
+        for doc_id, sent_id, page, sentence, source in self.connection.execute(
+                "SELECT doc_id, sent_id, page, sentence, source FROM sentences WHERE (doc_id, sent_id) IN "
+                "(SELECT doc_id, sent_id FROM postings WHERE token_id IN (SELECT token_id FROM hit_tokens)) ORDER BY doc_id, sent_id"):
+            doc_sentences[doc_id].append({'sent_id': sent_id, 'sentence': sentence, 'page': page, 'source': source, 'matches': []})
+
+        for doc_id, path in self.connection.execute("SELECT doc_id, path FROM documents ORDER BY doc_id").fetchall():
+            metrics = ScanMetrics(document=os.path.basename(path))
+            sentence_list = doc_sentences.pop(doc_id, [])
+            match_sentences(sentence_list, compiled, backend=backend, phrase_gap=phrase_gap, match_mode=match_mode,
+                            sensitivity=sensitivity, top_k=top_k, metrics=metrics, vocab_scores=vocab_scores)
+            with metrics.stage('collapse') as stage:
+                collapsed_df = collapse_sentence_data(sentence_list)
+                stage.count(rows=len(collapsed_df))
+            yield path, collapsed_df, metrics, None
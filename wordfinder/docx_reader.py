@@ -0,0 +1,136 @@
+"""
+Streaming reader for the text of a DOCX file.
+Only the needed part is read out of the zip archive and it is walked with incremental parsing,
+so images and embedded media are never extracted and no full XML tree is built.
+"""
+import posixpath
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+from collections import namedtuple
+
+from wordfinder.cache import content_hash
+
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+TEXT_TAG = WORD_NAMESPACE + 't'
+PARAGRAPH_TAG = WORD_NAMESPACE + 'p'
+PAGE_BREAK_TAG = WORD_NAMESPACE + 'lastRenderedPageBreak'
+DOCUMENT_PART = 'word/document.xml'
+# parts holding document text besides the body, in the order they are read: headers, footers, notes and comments
+TEXT_PART = re.compile(r'^word/(header|footer|footnotes|endnotes|comments)(\d*)\.xml$')
+TEXT_PART_ORDER = ['header', 'footer', 'footnotes', 'endnotes', 'comments']
+
+# One paragraph of document text with the page it sits at or below
+Segment = namedtuple('Segment', ['paragraph', 'page', 'text'])
+
+def text_parts(names):
+    """
+    The text parts among the zip member names: the document body first, then the other parts in TEXT_PART_ORDER
+    and by number, e.g. header1 before header2 before header10. The body is listed even when it is missing so
+    reading it raises KeyError.
+    """
+    parts = []
+    for name in names:
+        part_match = TEXT_PART.match(name)
+        if part_match:
+            parts.append((TEXT_PART_ORDER.index(part_match.group(1)), int(part_match.group(2) or 0), name))
+    return [DOCUMENT_PART] + [name for kind, number, name in sorted(parts)]
+
+def part_source(part):
+    """Short name of a text part for the source column, e.g. 'document', 'header1' or 'footnotes'."""
+    return posixpath.splitext(posixpath.basename(part))[0]
+
+class BudgetedReader:
+    """
+    Binary file wrapper adding every read to the budget's inflated XML bytes, whatever size the zip header claims,
+    and checking the budget's wall time on every read.
+    """
+
+    def __init__(self, file, budget):
+        self.file = file
+        self.budget = budget
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.budget.add_xml_bytes(len(data))
+        self.budget.check_time()
+        return data
+
+def iter_document_events(docx_file, part=DOCUMENT_PART, budget=None):
+    """
+    Yield the text events of a DOCX part in document order.
+    docx_file can be a path or a file-like object such as the uploaded file.
+    Events are ('paragraph', None) when a w:p starts, ('text', text) for each w:t and ('page_break', None)
+    for each w:lastRenderedPageBreak. Finished elements are cleared and dropped from their parent as the walk
+    goes so memory stays bounded by the nesting depth rather than the document size.
+    With a ScanBudget the bytes actually inflated are counted against its cap as they stream, so a zip bomb stops
+    at the cap.
+    """
+    with zipfile.ZipFile(docx_file, 'r') as zip_ref:
+        with zip_ref.open(part) as xml_file:
+            if budget is not None:
+                xml_file = BudgetedReader(xml_file, budget)
+            open_elements = []
+            for event, elem in ET.iterparse(xml_file, events=('start', 'end')):
+                if event == 'start':
+                    open_elements.append(elem)
+                    if elem.tag == PARAGRAPH_TAG:
+                        yield 'paragraph', None
+                    continue
+
+                open_elements.pop()
+                if elem.tag == TEXT_TAG:
+                    yield 'text', elem.text or ''
+                elif elem.tag == PAGE_BREAK_TAG:
+                    yield 'page_break', None
+                elem.clear()
+                if open_elements:
+                    open_elements[-1].remove(elem)
+
+def iter_segments(events):
+    """
+    Group the events from iter_document_events into one Segment per paragraph.
+    Text that comes before the first paragraph is paragraph 0. A paragraph holding a page break is
+    on the page after its first break, otherwise it keeps the page of the paragraph before it.
+    Newline characters inside the text are dropped.
+    """
+    paragraph = 0
+    page = 1
+    page_count = 0
+    texts = []
+    first_break = None
+    for event, text in events:
+        if event == 'text':
+            texts.append(text)
+        elif event == 'page_break':
+            page_count += 1
+            if first_break is None:
+                first_break = page_count
+        elif event == 'paragraph':
+            if paragraph or texts or first_break:
+                page = first_break + 1 if first_break else page
+                yield Segment(paragraph, page, ''.join(texts).replace('\n', ''))
+            paragraph += 1
+            texts = []
+            first_break = None
+    if paragraph or texts or first_break:
+        page = first_break + 1 if first_break else page
+        yield Segment(paragraph, page, ''.join(texts).replace('\n', ''))
+
+def log_segments(segments, log_file="xml_parsed_log.txt"):
+    """Pass the segments through unchanged while writing them to a readable debug log."""
+    with open(log_file, 'w') as log:
+        page = 1
+        for segment in segments:
+            if segment.page != page:
+                log.write(f'\n------------[page {segment.page}]------------------------------------------------------------\n\n')
+                page = segment.page
+            log.write(f'{segment.text}\n')
+            yield segment
+
+def fingerprint_segments(segments, fingerprints):
+    """Pass the segments through unchanged while appending a content hash of each non-blank paragraph to fingerprints."""
+    for segment in segments:
+        if segment.text.strip():
+            fingerprints.append(content_hash(segment.text))
+        yield segment
@@ -0,0 +1,252 @@
+"""
+Headless entry point for the Word Finder: parse, segment, match and collapse DOCX files without the streamlit UI.
+The word list and whitelist are compiled once and shared by every document in a batch.
+"""
+import io
+import os
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from wordfinder.budgets import UploadRejected
+from wordfinder.cache import CACHE_DIR, DiskCache, MemoryCache, TieredCache, content_hash
+
+from wordfinder.docx_reader import (DOCUMENT_PART, fingerprint_segments, iter_document_events, iter_segments, log_segments, part_source,
+                                    text_parts)
+from wordfinder.export import collapse_sentence_data, table_bytes
+from wordfinder.matching import SENSITIVITY, match_sentences
+from wordfinder.metrics import ScanMetrics, metrics_stage
+from wordfinder.pool import make_spawn_pool, worker_state
+from wordfinder.sentences import sentence_convert
+from wordfinder.similarity import DEFAULT_BACKEND
+from wordfinder.word_list import compile_word_list
+
+# bump when the matching output changes so stale cached results are not served
+RESULT_VERSION = '5'
+PART_WORKERS = 4 # threads reading the text parts of one document
+
+# Finished scan of one document: the per-sentence matches, the collapsed table and the ScanMetrics of the scan
+ScanResult = namedtuple('ScanResult', ['sentence_list', 'collapsed_df', 'metrics'])
+
+# scan results shared by every session of this server process and persisted across restarts
+RESULT_CACHE = TieredCache(MemoryCache(max_items=8), DiskCache(os.path.join(CACHE_DIR, 'results')))
+
+# matches of every sentence scanned by this server process, so a revised draft only rescores what changed
+SENTENCE_CACHE = MemoryCache(max_items=200000)
+
+# fingerprints of every paragraph of a finished scan, to tell how much of a revised draft is unchanged
+PARAGRAPH_CACHE = MemoryCache(max_items=100000)
+
+def match_key(word_key, sensitivity=SENSITIVITY, backend=DEFAULT_BACKEND, phrase_gap=None, match_mode='fuzzy', top_k=None):
+    """Key of a word list with the matching options, the namespace for reusing sentence and paragraph results."""
+    return content_hash(RESULT_VERSION, word_key, str(sensitivity), backend, str(phrase_gap), match_mode, str(top_k))
+
+def result_key(docx_hash, word_key, sensitivity=SENSITIVITY, backend=DEFAULT_BACKEND, phrase_gap=None, match_mode='fuzzy', top_k=None):
+    """
+    Cache key of a scan result from the DOCX content hash, the word list key (covering the word list and
+    whitelist contents) and every option that changes the matches.
+    """
+    return content_hash(docx_hash, match_key(word_key, sensitivity, backend, phrase_gap, match_mode, top_k))
+
+def paragraph_reuse(fingerprints, cache_key, cache=PARAGRAPH_CACHE):
+    """Share of the paragraph fingerprints recorded by an earlier finished scan under cache_key, from 0 to 1."""
+    seen = sum(1 for fingerprint in fingerprints if cache.get(content_hash(cache_key, 'paragraph', fingerprint)) is not None)
+    return seen / len(fingerprints) if fingerprints else 0
+
+def remember_paragraphs(fingerprints, cache_key, cache=PARAGRAPH_CACHE):
+    """Record the paragraph fingerprints of a finished scan under cache_key for paragraph_reuse."""
+    for fingerprint in fingerprints:
+        cache.put(content_hash(cache_key, 'paragraph', fingerprint), True)
+
+def make_scan_result(sentence_list, collapsed_df, metrics=None):
+    """Bundle a finished scan; the download files are only rendered when asked for."""
+    return ScanResult(sentence_list, collapsed_df, metrics)
+
+def read_part(docx_file, part, xml_logger=False, fingerprints=None, metrics=None, budget=None):
+    """
+    Stream the paragraphs of one text part of a DOCX file into sentence units numbered from 1.
+    When a fingerprints list is given the content hash of every non-blank paragraph is appended to it.
+    With a ScanMetrics the reading is timed as 'xml_parse' (inflating and parsing the part as it streams) and
+    'segmentation' (paragraphs into sentences, without the parse time).
+    """
+    events = iter_document_events(docx_file, part, budget)
+    if metrics is not None:
+        events = metrics.timed_iter(events, 'xml_parse')
+    segments = iter_segments(events)
+    if fingerprints is not None:
+        segments = fingerprint_segments(segments, fingerprints)
+    # Optionally write the paragraphs to a log file as they stream past
+    if xml_logger:
+        segments = log_segments(segments)
+    if metrics is None:
+        return sentence_convert(segments)
+
+    segment_count = [0]
+    def counted(segments):
+        for segment in segments:
+            segment_count[0] += 1
+            yield segment
+    parse = metrics['xml_parse']
+    parse_wall, parse_cpu = parse.wall, parse.cpu
+    with metrics.stage('segmentation') as stage:
+        sentence_list = sentence_convert(counted(segments))
+    # the parse ran inside the segmentation loop, so take its share back out
+    stage.add_time(parse_wall - parse.wall, parse_cpu - parse.cpu)
+    stage.count(paragraphs=segment_count[0], sentences=len(sentence_list))
+    return sentence_list
+
+def read_sentences(docx_file, xml_logger=False, fingerprints=None, metrics=None, budget=None):
+    """
+    Read every text part of a DOCX file (path or file-like object) into one list of sentence units: the document
+    body, then the headers, footers, footnotes, endnotes and comments. The parts are parsed and segmented on
+    PART_WORKERS threads, so the small parts are done while the body is still being read. Sentence ids run on
+    across the parts in that order, every sentence gets the part it came from as 'source' and sentences outside
+    the body have no page.
+    When a fingerprints list is given the content hash of every non-blank paragraph is appended to it.
+    With a ScanMetrics the archive directory is timed as 'unzip' and the parts as in read_part, their times
+    adding up. A ScanBudget caps the inflated XML size of all parts together and the sentence count.
+    xml_logger only logs the document body.
+    """
+    if isinstance(docx_file, (str, os.PathLike)):
+        open_docx = lambda: docx_file
+    else:
+        # every thread reads its own view of the bytes, a file object cannot be shared
+        docx_file.seek(0)
+        docx_data = docx_file.read()
+        open_docx = lambda: io.BytesIO(docx_data)
+    with metrics_stage(metrics, 'unzip') as stage:
+        with zipfile.ZipFile(open_docx(), 'r') as zip_ref:
+            part_infos = [zip_ref.getinfo(part) for part in text_parts(zip_ref.namelist())]
+        if stage is not None:
+            stage.count(parts=len(part_infos), xml_bytes=sum(info.file_size for info in part_infos),
+                        compressed_bytes=sum(info.compress_size for info in part_infos))
+    if budget is not None:
+        budget.check_xml_bytes(sum(info.file_size for info in part_infos))
+
+    def read(part):
+        part_metrics = ScanMetrics() if metrics is not None else None
+        part_fingerprints = [] if fingerprints is not None else None
+        sentence_list = read_part(open_docx(), part, xml_logger and part == DOCUMENT_PART, part_fingerprints, part_metrics, budget)
+        return sentence_list, part_fingerprints, part_metrics
+
+    parts = [info.filename for info in part_infos]
+    if len(parts) > 1:
+        with ThreadPoolExecutor(max_workers=min(PART_WORKERS, len(parts)), thread_name_prefix='wordfinder-part') as executor:
+            part_results = list(executor.map(read, parts))
+    else:
+        part_results = [read(part) for part in parts]
+
+    sentence_list = []
+    for part, (part_sentences, part_fingerprints, part_metrics) in zip(parts, part_results):
+        source = part_source(part)
+        for sent_item in part_sentences:
+            sent_item['sent_id'] += len(sentence_list)
+            sent_item['source'] = source
+            if part != DOCUMENT_PART:
+                sent_item['page'] = None
+        sentence_list.extend(part_sentences)
+        if fingerprints is not None:
+            fingerprints.extend(part_fingerprints)
+        if metrics is not None:
+            metrics.merge(part_metrics)
+    if budget is not None:
+        budget.check_sentences(len(sentence_list))
+    return sentence_list
+
+def read_upload(docx_data, budget, xml_logger=False, fingerprints=None, metrics=None):
+    """
+    read_sentences for the bytes of an uploaded DOCX, read from memory without temp files and within budget.
+    An archive that is not a DOCX raises UploadRejected instead of a zip or XML error.
+    """
+    try:
+        return read_sentences(io.BytesIO(docx_data), xml_logger, fingerprints, metrics, budget)
+    except zipfile.BadZipFile:
+        raise UploadRejected("This file is not a valid DOCX document. Please save it again as a Word document (.docx).") from None
+    except KeyError:
+        raise UploadRejected("This DOCX file has no document text (word/document.xml is missing).") from None
+    except ET.ParseError:
+        raise UploadRejected("The text of this DOCX file is damaged and cannot be read.") from None
+
+def scan_document(docx_file, compiled, backend=DEFAULT_BACKEND, workers=1, phrase_gap=None, match_mode='fuzzy',
+                  sensitivity=SENSITIVITY, top_k=None, progress_callback=None, metrics=None):
+    """
+    Scan one DOCX file against a CompiledWordList.
+    Returns (sentence_list, collapsed_df); collapsed_df is empty when nothing matched.
+    progress_callback is handed to match_sentences and every stage is timed into metrics when one is given.
+    """
+    metrics = metrics if metrics is not None else ScanMetrics()
+    sentence_list = read_sentences(docx_file, metrics=metrics)
+    match_sentences(sentence_list, compiled, backend=backend, workers=workers, phrase_gap=phrase_gap, match_mode=match_mode,
+                    sensitivity=sensitivity, top_k=top_k, progress_callback=progress_callback, metrics=metrics)
+    with metrics.stage('collapse') as stage:
+        collapsed_df = collapse_sentence_data(sentence_list)
+        stage.count(rows=len(collapsed_df))
+    return sentence_list, collapsed_df
+
+#FUNCTIONS TO SCAN MANY DOCUMENTS-------------------------------------
+def scan_worker_document(docx_path):
+    """scan_document against the word list compiled into this worker, returning the collapsed table and metrics."""
+    metrics = ScanMetrics(document=os.path.basename(docx_path))
+    sentence_list, collapsed_df = scan_document(docx_path, worker_state['compiled'], metrics=metrics, **worker_state['options'])
+    return collapsed_df, metrics
+
+def warm_up():
+    """
+    Run a tiny scan through matching, collapsing and the CSV export so the parts of pandas, numpy and fuzzywuzzy
+    that load on first use are in place before the first real scan. Returns the seconds it took.
+    """
+    started = time.perf_counter()
+    compiled = compile_word_list(['energy', 'clean energy'], [])
+    sentence_list = [{'sent_id': 1, 'sentence': 'Clean energy for everyone', 'page': 1, 'source': 'document', 'matches': []}]
+    match_sentences(sentence_list, compiled)
+    table_bytes(collapse_sentence_data(sentence_list))
+    return time.perf_counter() - started
+
+def find_docx_files(paths):
+    """Expand the given files and folders into the DOCX files to scan, skipping Word's ~$ lock files."""
+    docx_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            docx_paths.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith('.docx') and not name.startswith('~$')
+            )
+        else:
+            docx_paths.append(path)
+    return docx_paths
+
+def scan_documents(docx_paths, compiled, workers=1, backend=DEFAULT_BACKEND, phrase_gap=None, match_mode='fuzzy',
+                   sensitivity=SENSITIVITY, top_k=None, progress_callback=None):
+    """
+    Scan many DOCX files against one CompiledWordList, processing up to workers documents at once.
+    Yields (docx_path, collapsed_df, metrics, error) as each document finishes; error is None on success and the
+    raised exception otherwise, so one unreadable file does not stop the batch. metrics is the document's ScanMetrics.
+    progress_callback(stage, count, total) is called with stage 'documents' after each document.
+    """
+    options = {'backend': backend, 'phrase_gap': phrase_gap, 'match_mode': match_mode, 'sensitivity': sensitivity, 'top_k': top_k}
+    finished = 0
+    if workers > 1 and len(docx_paths) > 1:
+        with make_spawn_pool({'compiled': compiled, 'options': options}, min(workers, len(docx_paths))) as executor:
+            futures = {executor.submit(scan_worker_document, docx_path): docx_path for docx_path in docx_paths}
+            for future in as_completed(futures):
+                try:
+                    result = (futures[future], *future.result(), None)
+                except Exception as error:
+                    result = (futures[future], None, None, error)
+                finished += 1
+                if progress_callback:
+                    progress_callback('documents', finished, len(docx_paths))
+                yield result
+    else:
+        for docx_path in docx_paths:
+            metrics = ScanMetrics(document=os.path.basename(docx_path))
+            try:
+                result = (docx_path, scan_document(docx_path, compiled, metrics=metrics, **options)[1], metrics, None)
+            except Exception as error:
+                result = (docx_path, None, None, error)
+            finished += 1
+            if progress_callback:
+                progress_callback('documents', finished, len(docx_paths))
+            yield result
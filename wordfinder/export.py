@@ -0,0 +1,97 @@
+"""Collapsing of the per-sentence matches into the table offered for download, and writing it as CSV, Parquet or XLSX."""
+import importlib.util
+import io
+
+import pandas as pd
+
+# columns of the collapsed table, as documented in the FAQ
+EXPORT_COLUMNS = ['sent_id', 'list_matchs', 'found_words', 'match_certainty', 'sentence', 'page_at_or_below', 'source']
+
+# export format: (file extension, mime type, modules of which one must be installed)
+EXPORT_FORMATS = {
+    'csv': ('.csv', 'text/csv', ()),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet', ('pyarrow', 'fastparquet')),
+    'xlsx': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', ('openpyxl', 'xlsxwriter')),
+}
+CSV_CHUNK_ROWS = 10000 # rows rendered at a time when writing a CSV
+
+#FUNCTIONS TO EXPORT THE DATA-------------------------------------
+# Helper function to concatenate lists and strings
+def concat_lists_strings(series):
+    # Flatten lists and join with commas, each distinct item once in first seen order
+    return ', '.join(dict.fromkeys(map(str, [item for sublist in series for item in (sublist if isinstance(sublist, list) else [sublist])])))
+
+def collapse_sentence_data(sentence_list):
+    """
+    Collapse the matches into one row per matched sentence, or an empty DataFrame when nothing matched.
+    The per-sentence aggregates (matched list entries, found words, highest certainty) are accumulated straight
+    into columns in one pass over the matches. Matched entries and found words are listed once each in first seen
+    order, so the output does not depend on the hash seed.
+    """
+    columns = {column: [] for column in EXPORT_COLUMNS}
+    phrase_rows = False
+    unpaged_rows = False
+    for sent_item in sentence_list:
+        matches = sent_item['matches']
+        if not matches:
+            continue
+        list_matchs = {}
+        found_words = {}
+        match_certainty = None
+        for match in matches:
+            list_matchs.setdefault(str(match['match']))
+            found = match['found']
+            for item in (found if isinstance(found, list) else [found]):
+                found_words.setdefault(str(item))
+            if match['ratio'] is None:
+                phrase_rows = True
+            elif match_certainty is None or match['ratio'] > match_certainty:
+                match_certainty = match['ratio']
+        columns['sent_id'].append(sent_item['sent_id'])
+        columns['list_matchs'].append(', '.join(list_matchs))
+        columns['found_words'].append(', '.join(found_words))
+        columns['match_certainty'].append(match_certainty)
+        columns['sentence'].append(sent_item['sentence'])
+        columns['page_at_or_below'].append(sent_item['page'])
+        columns['source'].append(sent_item.get('source', 'document'))
+        if sent_item['page'] is None:
+            unpaged_rows = True
+
+    if not columns['sent_id']:
+        collapsed_df = pd.DataFrame()
+        return collapsed_df
+    collapsed_df = pd.DataFrame(columns)
+    if phrase_rows:
+        # phrase rows have no certainty, which makes the whole column a float column with blanks
+        collapsed_df['match_certainty'] = collapsed_df['match_certainty'].astype('float64')
+    if unpaged_rows:
+        # headers, footers, notes and comments have no page; keep the page numbers whole numbers with blanks
+        collapsed_df['page_at_or_below'] = collapsed_df['page_at_or_below'].astype('Int64')
+    return collapsed_df
+
+def available_formats():
+    """Export formats whose writer library is installed, CSV always being available."""
+    return [
+        export_format for export_format, (extension, mime, modules) in EXPORT_FORMATS.items()
+        if not modules or any(importlib.util.find_spec(module) for module in modules)
+    ]
+
+def write_table(collapsed_df, file, export_format='csv'):
+    """
+    Write the collapsed DataFrame to a path or binary file in export_format.
+    CSV is rendered CSV_CHUNK_ROWS rows at a time with a BOM so Excel picks up the encoding.
+    """
+    if export_format == 'csv':
+        collapsed_df.to_csv(file, encoding='utf-8-sig', index=False, chunksize=CSV_CHUNK_ROWS)
+    elif export_format == 'parquet':
+        collapsed_df.to_parquet(file, index=False)
+    elif export_format == 'xlsx':
+        collapsed_df.to_excel(file, index=False, sheet_name='matches')
+    else:
+        raise ValueError(f"Unknown export format '{export_format}'. Choose from: {', '.join(EXPORT_FORMATS)}")
+
+def table_bytes(collapsed_df, export_format='csv'):
+    """Render the collapsed DataFrame in export_format for a download."""
+    buffer = io.BytesIO()
+    write_table(collapsed_df, buffer, export_format)
+    return buffer.getvalue()
@@ -0,0 +1,123 @@
+"""
+Background jobs for long scans, so the streamlit script thread never blocks on matching.
+Jobs run on a bounded thread pool shared by every session of the server process. Each job publishes its progress
+to a small shared state that the UI polls, and can be cancelled while queued or running.
+"""
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_RUNNING_JOBS = int(os.environ.get('WORDFINDER_MAX_JOBS', 2)) # scans running at once across all sessions
+MAX_QUEUED_JOBS = int(os.environ.get('WORDFINDER_MAX_QUEUED_JOBS', 20)) # scans waiting before new ones are turned away
+
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+class JobCancelled(Exception):
+    """Raised inside a job by its progress callback once the job was cancelled."""
+
+class JobQueueFull(Exception):
+    """Raised by JobRunner.submit when MAX_QUEUED_JOBS jobs are already waiting."""
+
+class Job:
+    """
+    One background task and its shared state: state goes from 'queued' to 'running' and ends in one of
+    FINISHED_STATES. progress holds {stage: (count, total)} and messages the status lines written so far.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.state = 'queued'
+        self.progress = {}
+        self.messages = []
+        self.result = None
+        self.error = None
+        self.future = None
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def report(self, stage, count, total):
+        """progress_callback(stage, count, total) for the job's work; raises JobCancelled once the job is cancelled."""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+        with self.lock:
+            self.progress[stage] = (count, total)
+
+    def log(self, message):
+        """Add a status line for the UI; also a cancellation point."""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+        with self.lock:
+            self.messages.append(message)
+
+    def set_state(self, state, result=None, error=None):
+        with self.lock:
+            self.state = state
+            self.result = result
+            self.error = error
+
+    def snapshot(self):
+        """Consistent copy of (state, progress, messages) for rendering."""
+        with self.lock:
+            return self.state, dict(self.progress), list(self.messages)
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+class JobRunner:
+    """Thread pool running at most max_running jobs at once with at most max_queued jobs waiting."""
+
+    def __init__(self, max_running=MAX_RUNNING_JOBS, max_queued=MAX_QUEUED_JOBS):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.executor = ThreadPoolExecutor(max_workers=max_running, thread_name_prefix='wordfinder-job')
+        self.queue = [] # waiting jobs in submission order
+        self.job_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue fn(job, *args, **kwargs) and return its Job. fn should pass job.report as its progress callback
+        so the job can be followed and cancelled; its return value becomes job.result.
+        """
+        with self.lock:
+            if len(self.queue) >= self.max_queued:
+                raise JobQueueFull()
+            job = Job(next(self.job_ids))
+            self.queue.append(job)
+        job.future = self.executor.submit(self.run, job, fn, args, kwargs)
+        return job
+
+    def run(self, job, fn, args, kwargs):
+        with self.lock:
+            if job in self.queue:
+                self.queue.remove(job)
+        if job.cancel_event.is_set():
+            job.set_state('cancelled')
+            return
+        job.set_state('running')
+        try:
+            result = fn(job, *args, **kwargs)
+        except JobCancelled:
+            job.set_state('cancelled')
+        except Exception as error:
+            job.set_state('failed', error=error)
+        else:
+            job.set_state('done', result=result)
+
+    def queue_position(self, job):
+        """1 for the next job to start, 0 once the job has left the queue."""
+        with self.lock:
+            return self.queue.index(job) + 1 if job in self.queue else 0
+
+    def cancel(self, job):
+        """Stop a job: a queued job never starts, a running job stops at its next progress report."""
+        job.cancel_event.set()
+        with self.lock:
+            if job in self.queue and job.future is not None and job.future.cancel():
+                self.queue.remove(job)
+                job.set_state('cancelled')
+
+# jobs of every session of this server process
+JOB_RUNNER = JobRunner()
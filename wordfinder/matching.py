@@ -0,0 +1,435 @@
+"""
+Matching of document sentences against the word list.
+Sentences are interned into the vocabulary of the compiled word list, so each token is an integer id and a token
+that is on the list has the list token's id. Distinct sentence tokens are grouped into blocks of equal length and
+each block is scored against the list tokens that could still reach the sensitivity, either in this process or
+spread over a process pool. The hits are then mapped back onto the sentences as single word and phrase matches.
+"""
+import os
+from array import array
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import as_completed
+
+import numpy as np
+
+from wordfinder.cache import content_hash
+from wordfinder.metrics import ScanMetrics
+from wordfinder.pool import make_spawn_pool, worker_state
+from wordfinder.similarity import DEFAULT_BACKEND, get_score_matrix, ratio_upper_bound
+from wordfinder.tokens import intern_sentences
+
+SENSITIVITY = 75 # lowest fuzz.ratio that counts as a match
+# document tokens x list tokens below which scoring stays in this process: starting a spawn pool takes seconds,
+# while the scorer gets through roughly half a million pairs a second
+POOL_MIN_PAIRS = int(os.environ.get('WORDFINDER_POOL_MIN_PAIRS', 2000000))
+PHRASE_SENSITIVITY = 75 # a sentence token scoring over this against a list token counts towards that token's phrases
+
+#FUNCTIONS TO PRUNE THE WORD LIST-------------------------------------
+def build_word_index(list_vocab):
+    """Bucket the distinct tokens by length so whole buckets can be ruled out before scoring."""
+    word_index = defaultdict(list)
+    for word in list_vocab:
+        word_index[len(word)].append(word)
+    return word_index
+
+def candidate_words(word_index, sent_len, list_cutoffs):
+    """
+    Return the list tokens whose length still allows a score at or above their cutoff in list_cutoffs against a
+    token of sent_len. fuzz.ratio is 2*M/(len1+len2) where M can never exceed the shorter length.
+    """
+    candidates = []
+    for word_len, bucket in word_index.items():
+        best_ratio = ratio_upper_bound(min(sent_len, word_len), sent_len + word_len)
+        candidates.extend(word for word in bucket if best_ratio >= list_cutoffs[word])
+    return candidates
+
+def list_token_cutoffs(compiled, sensitivity=SENSITIVITY):
+    """
+    Lowest score worth keeping for every list token of a CompiledWordList: the lowest threshold among its single
+    word entries, each using its own "| 90" threshold or else sensitivity. Tokens that only appear in phrases are
+    cut off at 100, since a phrase only matches when its tokens are in the sentence as they are.
+    """
+    list_cutoffs = {word: 100 for word in compiled.list_vocab}
+    for list_id, positions in compiled.single_positions.items():
+        list_cutoffs[compiled.list_vocab[list_id]] = min(entry_cutoff(compiled.token_word_dict[position], sensitivity) for position in positions)
+    return list_cutoffs
+
+def entry_cutoff(word_phrase, sensitivity=SENSITIVITY):
+    """Lowest score a word list entry accepts: its own threshold when the line had one, sensitivity otherwise."""
+    return sensitivity if word_phrase['sensitivity'] is None else word_phrase['sensitivity']
+
+#FUNCTIONS TO SCORE THE VOCABULARY-------------------------------------
+# Above threshold scores of the document vocabulary in CSR form: the hits of the token with id i are the list token
+# ids list_ids[offsets[i]:offsets[i + 1]] with the matching scores, so memory follows the number of hits
+SparseHits = namedtuple('SparseHits', ['offsets', 'list_ids', 'scores'])
+
+def score_block(sent_block, word_index, list_cutoffs, backend=DEFAULT_BACKEND):
+    """
+    Score a block of equal length sentence tokens. Returns {sent_word: {list_word: ratio}} for the hits and the
+    number of pairs handed to the backend after the length pruning.
+    """
+    block_scores = {sent_word: {} for sent_word in sent_block}
+    list_block = candidate_words(word_index, len(sent_block[0]), list_cutoffs)
+    if list_block:
+        # the backend stops working on a pair as soon as it cannot reach that list token's cutoff
+        block_cutoffs = np.array([list_cutoffs[word] for word in list_block], dtype=np.int16)
+        scores = get_score_matrix(backend)(sent_block, list_block, score_cutoff=block_cutoffs)
+        for row, col in zip(*np.nonzero(scores >= block_cutoffs)):
+            block_scores[sent_block[row]][list_block[col]] = int(scores[row, col])
+    return block_scores, len(sent_block) * len(list_block)
+
+def score_worker_block(sent_block):
+    """score_block against the word list compiled into this worker."""
+    return score_block(sent_block, worker_state['word_index'], worker_state['list_cutoffs'], worker_state['backend'])
+
+def score_vocabulary(sent_vocab, word_index, list_cutoffs, backend=DEFAULT_BACKEND, block_size=256, workers=1, progress_callback=None,
+                     stage=None):
+    """Score every distinct sentence token once against the list tokens that could reach their cutoff.
+
+    list_cutoffs maps every list token to the lowest score worth keeping for it, see list_token_cutoffs.
+    Tokens of equal length are scored together as one matrix by the similarity backend.
+    With workers above 1 and at least POOL_MIN_PAIRS token pairs the blocks are spread over a process pool; the
+    word list is sent to each worker once. Smaller vocabularies are scored in this process.
+    Returns {sent_word: {list_word: ratio}} in sent_vocab order holding only the scores at or above the cutoffs,
+    so repeated tokens across the document share one set of scores.
+    When a StageMetrics is given as stage the pairs handed to the backend are counted as pairs_scored.
+    """
+    vocab_scores = {sent_word: {} for sent_word in sent_vocab}
+    blocks = []
+    for sent_bucket in build_word_index(sent_vocab).values():
+        for block_start in range(0, len(sent_bucket), block_size):
+            blocks.append(sent_bucket[block_start:block_start + block_size])
+
+    scored_count = 0
+    total_pairs = len(sent_vocab) * sum(len(bucket) for bucket in word_index.values())
+    if workers > 1 and len(blocks) > 1 and total_pairs >= POOL_MIN_PAIRS:
+        state = {'word_index': word_index, 'list_cutoffs': list_cutoffs, 'backend': backend}
+        with make_spawn_pool(state, min(workers, len(blocks))) as executor:
+            futures = {executor.submit(score_worker_block, sent_block): sent_block for sent_block in blocks}
+            try:
+                for future in as_completed(futures):
+                    block_scores, pair_count = future.result()
+                    vocab_scores.update(block_scores)
+                    if stage is not None:
+                        stage.count(pairs_scored=pair_count)
+                    scored_count += len(futures[future])
+                    if progress_callback:
+                        progress_callback(scored_count, len(sent_vocab))
+            except BaseException:
+                # drop the blocks not started yet, e.g. when the progress callback cancels the scan
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    else:
+        for sent_block in blocks:
+            block_scores, pair_count = score_block(sent_block, word_index, list_cutoffs, backend)
+            vocab_scores.update(block_scores)
+            if stage is not None:
+                stage.count(pairs_scored=pair_count)
+            scored_count += len(sent_block)
+            if progress_callback:
+                progress_callback(scored_count, len(sent_vocab))
+    return vocab_scores
+
+def compact_scores(vocab_scores, vocabulary):
+    """
+    Pack the {sent_word: {list_word: ratio}} output of score_vocabulary into SparseHits with one row per
+    vocabulary id, so the hits of a token are looked up by its id. Tokens that were not scored get no hits.
+    """
+    offsets = array('I', [0])
+    hit_ids = array('I')
+    scores = array('B')
+    for token in vocabulary.tokens:
+        for word, word_ratio in vocab_scores.get(token, {}).items():
+            hit_ids.append(vocabulary.ids[word])
+            scores.append(word_ratio)
+        offsets.append(len(hit_ids))
+    return SparseHits(offsets, hit_ids, scores)
+
+def token_hits(sparse_hits, token_id):
+    """Return the (list token id, ratio) hits of one document token."""
+    start, end = sparse_hits.offsets[token_id], sparse_hits.offsets[token_id + 1]
+    return zip(sparse_hits.list_ids[start:end], sparse_hits.scores[start:end])
+
+#FUNCTIONS TO MATCH PHRASES-------------------------------------
+def build_phrase_index(token_word_dict, entry_ids):
+    """
+    Index the multi word phrases by the ids of their component tokens; entry_ids holds the token ids of every
+    entry of token_word_dict.
+    Returns {token id: [phrase position in token_word_dict]} and {phrase position: number of distinct tokens}.
+    """
+    phrase_index = defaultdict(list)
+    phrase_sizes = {}
+    for position, word_phrase in enumerate(token_word_dict):
+        if word_phrase['phrase_type'] == 'multi_word':
+            distinct_ids = set(entry_ids[position])
+            for token_id in distinct_ids:
+                phrase_index[token_id].append(position)
+            phrase_sizes[position] = len(distinct_ids)
+    return dict(phrase_index), phrase_sizes
+
+def phrase_in_order(token_sent, word_tokens, phrase_gap):
+    """
+    True when word_tokens appear in token_sent in order with at most phrase_gap other tokens between neighbours.
+    Works on token strings or token ids alike.
+    """
+    positions = defaultdict(list)
+    for position, sent_word in enumerate(token_sent):
+        positions[sent_word].append(position)
+    reachable = positions[word_tokens[0]]
+    for word in word_tokens[1:]:
+        reachable = [position for position in positions[word] if any(0 < position - previous <= phrase_gap + 1 for previous in reachable)]
+        if not reachable:
+            return False
+    return bool(reachable)
+
+def match_phrases(found_ids, sent_ids, vocabulary, compiled, phrase_gap=None):
+    """
+    Return (word_phrase, matched tokens in phrase order) for the multi word phrases of a CompiledWordList whose
+    token ids are all among the distinct found_ids, with vocabulary the document vocabulary the ids come from. Only
+    phrases sharing a token with found_ids are looked at, and they come back in word list order. With phrase_gap
+    set the phrase tokens must also appear in order in the sentence ids sent_ids with at most phrase_gap other
+    tokens between neighbours.
+    """
+    token_counts = defaultdict(int)
+    for token_id in found_ids:
+        for position in compiled.phrase_index.get(token_id, ()):
+            token_counts[position] += 1
+
+    phrase_hits = []
+    found_set = None
+    for position in sorted(token_counts):
+        if token_counts[position] == compiled.phrase_sizes[position]:
+            word_phrase = compiled.token_word_dict[position]
+            if phrase_gap is None or phrase_in_order(sent_ids, compiled.entry_ids[position], phrase_gap):
+                # compare the strings rather than the ids and keep the phrase's word order, so the output does not
+                # depend on set ordering
+                if found_set is None:
+                    found_set = set([vocabulary.tokens[token_id] for token_id in found_ids])
+                phrase_hits.append((word_phrase, [word for word in dict.fromkeys(word_phrase['word_tokens']) if word in found_set]))
+    return phrase_hits
+
+#FUNCTIONS FOR EXACT MATCHES-------------------------------------
+# Aho-Corasick automaton over token ids: goto[state] maps a token id to the next state, fail[state] is the longest
+# proper suffix state and output[state] lists the word list positions of every entry ending in that state
+Automaton = namedtuple('Automaton', ['goto', 'fail', 'output'])
+
+def build_automaton(entry_ids):
+    """Compile the token ids of every word list entry, single word or phrase, into one Aho-Corasick automaton."""
+    goto = [{}]
+    output = [[]]
+    for position, word_ids in enumerate(entry_ids):
+        state = 0
+        for token_id in word_ids:
+            if token_id not in goto[state]:
+                goto.append({})
+                output.append([])
+                goto[state][token_id] = len(goto) - 1
+            state = goto[state][token_id]
+        output[state].append(position)
+
+    #breadth first so every fail target is complete before the states that point at it
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for token_id, next_state in goto[state].items():
+            fallback = fail[state]
+            while fallback and token_id not in goto[fallback]:
+                fallback = fail[fallback]
+            if state:
+                fail[next_state] = goto[fallback].get(token_id, 0)
+            output[next_state] = sorted(output[next_state] + output[fail[next_state]])
+            queue.append(next_state)
+    return Automaton(goto, fail, output)
+
+def iter_exact_hits(automaton, sent_ids):
+    """Yield (word list position, index of the last token) for every exact, contiguous occurrence of a list entry."""
+    state = 0
+    for index, token_id in enumerate(sent_ids):
+        while state and token_id not in automaton.goto[state]:
+            state = automaton.fail[state]
+        state = automaton.goto[state].get(token_id, 0)
+        for position in automaton.output[state]:
+            yield position, index
+
+def match_sentences_exact(sentence_list, compiled, progress_callback=None, metrics=None):
+    """
+    Exact only pre-screen: one automaton pass per sentence records single words with ratio 100 and phrases whose
+    tokens appear contiguously and in order, with no fuzzy scoring at all. Timed as the 'exact_match' stage.
+    """
+    metrics = metrics if metrics is not None else ScanMetrics()
+    with metrics.stage('exact_match') as stage:
+        match_exact(sentence_list, compiled, progress_callback, stage)
+    return sentence_list
+
+def match_exact(sentence_list, compiled, progress_callback, stage):
+    """Body of match_sentences_exact, counting into the StageMetrics stage."""
+    vocabulary = compiled.vocabulary.copy()
+    sent_offsets, sent_token_ids = intern_sentences(sentence_list, vocabulary)
+    stage.count(sentences=len(sentence_list), tokens=len(sent_token_ids), list_terms=len(compiled.token_word_dict))
+    if progress_callback:
+        progress_callback('phrase', 0, len(sentence_list))
+    for sent_number, sent_item in enumerate(sentence_list):
+        sent_ids = sent_token_ids[sent_offsets[sent_number]:sent_offsets[sent_number + 1]]
+        phrase_positions = set()
+        for position, index in iter_exact_hits(compiled.automaton, sent_ids):
+            word_phrase = compiled.token_word_dict[position]
+            if word_phrase['phrase_type'] == 'single_word':
+                if sent_ids[index] not in compiled.white_ids:
+                    sent_item['matches'].append({
+                        'match': word_phrase['word_tokens'][0],
+                        'ratio': 100,
+                        'found': vocabulary.tokens[sent_ids[index]]
+                        })
+            else:
+                phrase_positions.add(position)
+        for position in sorted(phrase_positions):
+            word_phrase = compiled.token_word_dict[position]
+            sent_item['matches'].append({
+                'match': word_phrase['word_orig'],
+                'ratio': None,
+                'found': list(dict.fromkeys(word_phrase['word_tokens']))
+                })
+        stage.count(matches=len(sent_item['matches']))
+        if progress_callback:
+            progress_callback('phrase', sent_number + 1, len(sentence_list))
+
+#FUNCTIONS TO CHECK THE SENTENCES AGAINST THE WORD LIST-------------------------------------
+# 'fuzzy' scores every token, 'exact_first' only scores tokens that are not exactly a single word on the list,
+# 'exact' skips fuzzy scoring altogether
+MATCH_MODES = ('fuzzy', 'exact_first', 'exact')
+
+def match_sentences(sentence_list, compiled, backend=DEFAULT_BACKEND, workers=1, phrase_gap=None, sensitivity=SENSITIVITY,
+                    match_mode='fuzzy', top_k=None, progress_callback=None, metrics=None, budget=None, vocab_scores=None):
+    """
+    Append the single word and phrase matches of every sentence to its 'matches' list.
+    compiled is a CompiledWordList from compile_word_list. progress_callback(stage, count, total) is called with
+    stage 'single' while the document vocabulary is scored and 'phrase' while the matches are mapped onto the
+    sentences, starting with a count of 0 for each stage.
+    With match_mode 'exact_first' a token that is exactly a single word on the list is resolved with ratio 100
+    and not fuzzy scored, so its near matches are not reported. 'exact' hands over to match_sentences_exact.
+    sensitivity (1-100) is the lowest score of a single word match for entries without their own "| 90" threshold;
+    phrases always take the tokens scoring over PHRASE_SENSITIVITY.
+    With top_k set only the top_k best scoring list tokens of each sentence token are reported, ties going to
+    the token higher up the list.
+    The work is timed into metrics, a ScanMetrics, as the 'single_match' and 'phrase_match' stages.
+    A ScanBudget stops the scan before scoring when the document tokens x list tokens pairs are over its cap.
+    vocab_scores is the score_vocabulary output for a wider vocabulary scored with list_token_cutoffs(compiled,
+    sensitivity), e.g. the vocabulary of a corpus index; when given the document's tokens are not scored again.
+    """
+    if match_mode not in MATCH_MODES:
+        raise ValueError(f"Unknown match mode '{match_mode}'. Choose from: {', '.join(MATCH_MODES)}")
+    if not 1 <= sensitivity <= 100:
+        raise ValueError(f"The sensitivity must be between 1 and 100, not {sensitivity}.")
+    if top_k is not None and top_k < 1:
+        raise ValueError(f"top_k must be at least 1, not {top_k}.")
+    if phrase_gap is not None and phrase_gap < 0:
+        raise ValueError(f"phrase_gap must be 0 or more, not {phrase_gap}.")
+    metrics = metrics if metrics is not None else ScanMetrics()
+    if match_mode == 'exact':
+        return match_sentences_exact(sentence_list, compiled, progress_callback, metrics)
+
+    def report(stage, count, total):
+        if progress_callback:
+            progress_callback(stage, count, total)
+
+    with metrics.stage('single_match') as stage:
+        #intern the document into a copy of the word list vocabulary so every distinct token is scored only once
+        vocabulary = compiled.vocabulary.copy()
+        sent_offsets, sent_token_ids = intern_sentences(sentence_list, vocabulary)
+        doc_ids = list(dict.fromkeys(sent_token_ids))
+        exact_ids = set()
+        if match_mode == 'exact_first':
+            exact_ids = {token_id for token_id in doc_ids if token_id in compiled.single_positions}
+        fuzzy_vocab = [vocabulary.tokens[token_id] for token_id in doc_ids if token_id not in exact_ids]
+        if budget is not None and vocab_scores is None:
+            budget.check_pairs(len(fuzzy_vocab) * len(compiled.list_vocab))
+        report('single', 0, len(fuzzy_vocab))
+
+        #only the scores at or above each list token's cutoff are kept, packed per token id
+        if vocab_scores is None:
+            vocab_scores = score_vocabulary(fuzzy_vocab, compiled.word_index, list_token_cutoffs(compiled, sensitivity), backend, workers=workers,
+                                            progress_callback=lambda count, total: report('single', count, total), stage=stage)
+        else:
+            report('single', len(fuzzy_vocab), len(fuzzy_vocab))
+        sparse_hits = compact_scores(vocab_scores, vocabulary)
+        del vocab_scores
+
+        #single word hits and phrase qualification only depend on the sentence token, so resolve them once per token id
+        entry_cutoffs = {position: entry_cutoff(compiled.token_word_dict[position], sensitivity)
+                         for positions in compiled.single_positions.values() for position in positions}
+        single_hits = {}
+        qualified = bytearray(len(vocabulary))
+        for token_id in doc_ids:
+            sent_word = vocabulary.tokens[token_id]
+            if token_id in exact_ids:
+                is_white = token_id in compiled.white_ids
+                single_hits[token_id] = [] if is_white else [(sent_word, 100)] * len(compiled.single_positions[token_id])
+                qualified[token_id] = True
+                continue
+            hits = []
+            for list_id, word_ratio in token_hits(sparse_hits, token_id):
+                # phrases keep their own fixed bar, so a strict sensitivity does not rule out exact phrase tokens
+                if word_ratio > PHRASE_SENSITIVITY:
+                    qualified[token_id] = True
+                if token_id not in compiled.white_ids:
+                    hits.extend((position, list_id, word_ratio) for position in compiled.single_positions.get(list_id, ())
+                                if word_ratio >= entry_cutoffs[position])
+            if top_k and hits:
+                best_ids = {list_id for neg_ratio, list_id in sorted({(-word_ratio, list_id) for position, list_id, word_ratio in hits})[:top_k]}
+                hits = [hit for hit in hits if hit[1] in best_ids]
+            single_hits[token_id] = [(compiled.list_vocab[list_id], word_ratio) for position, list_id, word_ratio in sorted(hits)]
+        stage.count(sentences=len(sentence_list), tokens=len(sent_token_ids), distinct_tokens=len(doc_ids),
+                    list_terms=len(compiled.token_word_dict), list_tokens=len(compiled.list_vocab),
+                    exact_tokens=len(exact_ids), single_matches=sum(len(single_hits[token_id]) for token_id in sent_token_ids))
+        if 'pairs_scored' in stage.counts:
+            # pairs_scored was counted while scoring, everything else was ruled out by length or the exact lookup
+            stage.count(pairs_pruned=len(doc_ids) * len(compiled.list_vocab) - stage.counts['pairs_scored'])
+
+    with metrics.stage('phrase_match') as stage:
+        #map the vocabulary results back onto each sentence
+        report('phrase', 0, len(sentence_list))
+        stage.count(sentences=len(sentence_list))
+        for sent_number, sent_item in enumerate(sentence_list):
+            sent_ids = sent_token_ids[sent_offsets[sent_number]:sent_offsets[sent_number + 1]]
+            for token_id in sent_ids:
+                for word, word_ratio in single_hits[token_id]:
+                    sent_item['matches'].append({
+                        'match': word,
+                        'ratio': word_ratio,
+                        'found': vocabulary.tokens[token_id]
+                        })
+
+            # check if all multi-word phrases are found in words that are matched over 75% and add them to the sentence item matches
+            found_ids = [token_id for token_id in dict.fromkeys(sent_ids) if qualified[token_id]]
+            for word_phrase, words_extract in match_phrases(found_ids, sent_ids, vocabulary, compiled, phrase_gap):
+                sent_item['matches'].append({
+                    'match': word_phrase['word_orig'],
+                    'ratio': None,
+                    'found': words_extract
+                    })
+                stage.count(phrase_matches=1)
+            report('phrase', sent_number + 1, len(sentence_list))
+    return sentence_list
+
+def match_sentences_incremental(sentence_list, compiled, sentence_cache, cache_key, **options):
+    """
+    match_sentences that reuses the matches of sentences already matched by an earlier scan.
+    A sentence's matches only depend on its own text, the word list and the matching options, so they are cached
+    under a hash of cache_key (covering the word list and options) and the sentence text; only sentences never seen
+    before are scored. sentence_cache needs get/put, e.g. a MemoryCache. Returns the number of sentences reused.
+    """
+    new_sentences = []
+    sentence_keys = {}
+    for sent_item in sentence_list:
+        sentence_key = content_hash(cache_key, sent_item['sentence'])
+        cached_matches = sentence_cache.get(sentence_key)
+        if cached_matches is None:
+            new_sentences.append(sent_item)
+            sentence_keys[sent_item['sent_id']] = sentence_key
+        else:
+            sent_item['matches'] = list(cached_matches)
+    match_sentences(new_sentences, compiled, **options)
+    for sent_item in new_sentences:
+        sentence_cache.put(sentence_keys[sent_item['sent_id']], list(sent_item['matches']))
+    return len(sentence_list) - len(new_sentences)
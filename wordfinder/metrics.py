@@ -0,0 +1,180 @@
+"""
+Per-stage instrumentation of a scan: wall time, CPU time, item counts and peak memory for every pipeline stage.
+A ScanMetrics travels with the scan and ends up in the UI metrics panel, the JSON sidecar and one log line.
+"""
+import cProfile
+import json
+import logging
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+logger = logging.getLogger('wordfinder')
+
+# pipeline stages in the order they run, 'exact_match' replacing the two match stages in exact mode
+STAGES = ['unzip', 'xml_parse', 'segmentation', 'word_list', 'single_match', 'phrase_match', 'exact_match', 'collapse', 'export']
+
+def peak_rss_mb():
+    """High-water mark of this process's resident memory in MB, or None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return round(peak / (2**20 if sys.platform == 'darwin' else 2**10), 1)
+
+class StageMetrics:
+    """Wall and CPU seconds, counts and memory of one stage; times add up when a stage is entered more than once."""
+
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.counts = {}
+        self.peak_rss_mb = None
+        self.traced_peak_mb = None
+
+    def add_time(self, wall, cpu):
+        self.wall += wall
+        self.cpu += cpu
+
+    def count(self, **counts):
+        """Add to the item counts of this stage, e.g. count(sentences=120)."""
+        for name, value in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def to_dict(self):
+        return {
+            'wall_seconds': round(self.wall, 4),
+            'cpu_seconds': round(self.cpu, 4),
+            'counts': dict(self.counts),
+            'peak_rss_mb': self.peak_rss_mb,
+            'traced_peak_mb': self.traced_peak_mb,
+        }
+
+class ScanMetrics:
+    """
+    Metrics of one scan by stage name. CPU time is the time of the scanning thread; worker processes are not included.
+    The traced peak is only recorded while tracemalloc is tracing, e.g. with PYTHONTRACEMALLOC=1.
+    """
+
+    def __init__(self, **details):
+        self.details = details # free form facts about the scan such as the match mode
+        self.stages = {}
+
+    def __getitem__(self, name):
+        return self.stages.setdefault(name, StageMetrics())
+
+    @contextmanager
+    def stage(self, name):
+        """Time the block as stage name and yield its StageMetrics for the counts."""
+        stage = self[name]
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            yield stage
+        finally:
+            stage.add_time(time.perf_counter() - wall_start, time.thread_time() - cpu_start)
+            stage.peak_rss_mb = peak_rss_mb()
+            if tracing:
+                traced_peak = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+                stage.traced_peak_mb = max(stage.traced_peak_mb or 0, traced_peak)
+
+    def merge(self, other):
+        """Add the times and counts of another ScanMetrics, e.g. one kept by a worker thread, to these stages."""
+        for name, other_stage in other.stages.items():
+            stage = self[name]
+            stage.add_time(other_stage.wall, other_stage.cpu)
+            stage.count(**other_stage.counts)
+            for attribute in ('peak_rss_mb', 'traced_peak_mb'):
+                values = [value for value in (getattr(stage, attribute), getattr(other_stage, attribute)) if value is not None]
+                setattr(stage, attribute, max(values) if values else None)
+
+    def copy(self):
+        """Independent copy with the same details and stages, e.g. to time more work without touching shared metrics."""
+        metrics = ScanMetrics(**self.details)
+        metrics.merge(self)
+        return metrics
+
+    def timed_iter(self, iterable, name):
+        """Pass the items of iterable through, adding the time spent producing them to stage name."""
+        stage = self[name]
+        iterator = iter(iterable)
+        while True:
+            wall_start, cpu_start = time.perf_counter(), time.thread_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                stage.add_time(time.perf_counter() - wall_start, time.thread_time() - cpu_start)
+                stage.peak_rss_mb = peak_rss_mb()
+                return
+            stage.add_time(time.perf_counter() - wall_start, time.thread_time() - cpu_start)
+            yield item
+
+    def total_seconds(self):
+        return sum(stage.wall for stage in self.stages.values())
+
+    def to_dict(self):
+        ordered = sorted(self.stages, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES))
+        return {
+            'details': dict(self.details),
+            'total_seconds': round(self.total_seconds(), 4),
+            'stages': {name: self.stages[name].to_dict() for name in ordered},
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, default=str)
+
+    def rows(self):
+        """One flat dict per stage for a table in the UI."""
+        return [
+            {'stage': name, 'wall (s)': values['wall_seconds'], 'cpu (s)': values['cpu_seconds'],
+             'peak memory (MB)': values['peak_rss_mb'],
+             'counts': ', '.join(f'{count}={value}' for count, value in values['counts'].items())}
+            for name, values in self.to_dict()['stages'].items()
+        ]
+
+    def log_line(self):
+        """Single line summary: total and per-stage wall seconds followed by every count as stage.count=value."""
+        parts = [f'total={self.total_seconds():.3f}s']
+        parts.extend(f'{name}={stage.wall:.3f}s' for name, stage in self.stages.items())
+        for name, stage in self.stages.items():
+            parts.extend(f'{name}.{count}={value}' for count, value in stage.counts.items())
+        parts.extend(f'{name}={value}' for name, value in self.details.items())
+        return 'scan metrics ' + ' '.join(parts)
+
+    def log(self, level=logging.INFO):
+        logger.log(level, self.log_line())
+
+def metrics_stage(metrics, name):
+    """metrics.stage(name), or a do nothing context yielding None when metrics is None."""
+    return metrics.stage(name) if metrics is not None else nullcontext()
+
+@contextmanager
+def profile_to(path):
+    """
+    Opt-in profiler hook: run the block under cProfile and dump the stats to path, readable by pstats, snakeviz
+    or flameprof for a flame graph. Does nothing when path is empty. Only the calling thread is profiled.
+    """
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError: # another profiler is already active (Python 3.12+ allows only one)
+        logger.warning('profiler busy, %s not written', path)
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        logger.info('profile written to %s', path)
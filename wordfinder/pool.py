@@ -0,0 +1,20 @@
+"""
+Process pools for spreading a job over the CPUs. Workers are spawned rather than forked, since the streamlit server
+process runs other threads, and receive the read-only state of the job (e.g. the compiled word list) once through
+the pool initializer instead of with every task.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# state of the job the pool was made for, set once in each worker process by init_worker
+worker_state = {}
+
+def init_worker(state):
+    """Pool initializer storing the job state in the worker process."""
+    worker_state.clear()
+    worker_state.update(state)
+
+def make_spawn_pool(state, workers):
+    """ProcessPoolExecutor of workers spawned processes, each with the dict state in worker_state."""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=init_worker, initargs=(state,))
@@ -0,0 +1,44 @@
+"""Segmentation of the paragraph segments from the DOCX reader into sentence units."""
+import re
+
+def process_sentences(part, page_number, sentence_list, sentence_id, current_sentence):
+    """Processes the part into sentences and handles combining short sentences."""
+    # Pattern explanation:
+    # (?<!\d)\.   => match a period (.) that is NOT preceded by a digit (\d)
+    # (?=\s|$)    => ensure the period is followed by a space or end of string (optional for better cleanup)
+    sentences = re.split(r'(?<!\d)\.(?=\s|$)', part)
+    for sentence in sentences:
+        sentence = sentence.strip()
+        if sentence:
+            if len(sentence.split()) < 5 and current_sentence:
+                current_sentence += ' ' + sentence
+            else:
+                if current_sentence:
+                    sentence_list.append({'sent_id': sentence_id, 'sentence': current_sentence, 'page': page_number, 'matches':[]})
+                    #sentence_list.append({'sent_id': sentence_id, 'sentence': current_sentence.lower(), 'page': page_number, 'matches':[], 'found_words':[]})
+                    sentence_id += 1
+                current_sentence = sentence
+    return sentence_list, sentence_id, current_sentence
+
+def add_last_sentence(sentence_list, sentence_id, current_sentence, page_number):
+    """Adds the last sentence to the sentence list if there is any."""
+    if current_sentence:
+        sentence_list.append({'sent_id': sentence_id, 'sentence': current_sentence, 'page': page_number, 'matches':[]})
+        #sentence_list.append({'sent_id': sentence_id, 'sentence': current_sentence, 'page': page_number, 'matches':[], 'found_words':[]})
+    return sentence_list
+
+def sentence_convert(segments):
+    """Main function to turn the paragraph segments from iter_segments into sentence units."""
+    sentence_list = []
+    sentence_id = 1
+    page_number = 1
+    current_sentence = ""
+
+    for segment in segments:
+        page_number = segment.page
+        
+        if segment.text.strip():
+            sentence_list, sentence_id, current_sentence = process_sentences(segment.text, page_number, sentence_list, sentence_id, current_sentence)
+    
+    sentence_list = add_last_sentence(sentence_list, sentence_id, current_sentence, page_number)
+    return sentence_list
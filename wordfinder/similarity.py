@@ -0,0 +1,171 @@
+"""
+Batched similarity backends. Every backend takes a block of sentence tokens and a block of list tokens and
+returns a score matrix of fuzz.ratio compatible scores (0-100), shape (len(sent_tokens), len(list_tokens)).
+Scores that fall below score_cutoff are reported as 0 so backends are free to skip them. score_cutoff is either one
+score for the whole block or a sequence with one score per list token.
+"""
+import random
+import sys
+import warnings
+from collections import Counter
+
+import numpy as np
+from fuzzywuzzy import fuzz
+
+DEFAULT_BACKEND = 'fuzzywuzzy'
+MAX_BITS = 64 # longest list token the bit-parallel kernel handles in one machine word
+# without python-Levenshtein fuzzywuzzy falls back to difflib's Ratcliff/Obershelp ratio, which the numpy backend
+# does not reproduce
+LEVENSHTEIN_RATIO = fuzz.SequenceMatcher.__module__ != 'difflib'
+
+def ratio_upper_bound(common_chars, total_len):
+    """Highest fuzz.ratio two strings can reach when at most common_chars characters line up."""
+    if total_len == 0:
+        return 100
+    return int(round(100 * (2.0 * common_chars / total_len)))
+
+#REFERENCE BACKEND-------------------------------------
+def fuzzywuzzy_score_matrix(sent_tokens, list_tokens, score_cutoff=0):
+    """
+    Reference backend calling fuzz.ratio for each pair.
+    fuzz.ratio is 2*M/(len1+len2) where M can never exceed the shared character count,
+    so pairs whose bound falls short of score_cutoff are skipped without scoring.
+    """
+    scores = np.zeros((len(sent_tokens), len(list_tokens)), dtype=np.int16)
+    list_chars = [Counter(word) for word in list_tokens]
+    list_cutoffs = np.broadcast_to(score_cutoff, (len(list_tokens),)).tolist()
+    for row, sent_word in enumerate(sent_tokens):
+        sent_chars = Counter(sent_word)
+        for col, word in enumerate(list_tokens):
+            word_cutoff = list_cutoffs[col]
+            if word_cutoff:
+                common_chars = sum(min(count, list_chars[col][char]) for char, count in sent_chars.items())
+                if ratio_upper_bound(common_chars, len(sent_word) + len(word)) < word_cutoff:
+                    continue
+            word_ratio = fuzz.ratio(sent_word, word)
+            if word_ratio >= word_cutoff:
+                scores[row, col] = word_ratio
+    return scores
+
+#VECTORIZED BACKEND-------------------------------------
+def indel_ratio(s1, s2):
+    """Pure python fuzz.ratio (Levenshtein flavour) via the longest common subsequence, used for oversized tokens."""
+    if s1 == s2:
+        return 100
+    if not s1 or not s2:
+        return 0
+    prev = [0] * (len(s2) + 1)
+    for char in s1:
+        cur = [0]
+        for col, other in enumerate(s2, start=1):
+            cur.append(prev[col - 1] + 1 if char == other else max(prev[col], cur[col - 1]))
+        prev = cur
+    total_len = len(s1) + len(s2)
+    return int(round(100 * ((total_len - (total_len - 2 * prev[-1])) / total_len)))
+
+def popcount(values):
+    """Count the set bits of a uint64 array."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values).astype(np.int32)
+    byte_counts = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.int32)
+    return byte_counts[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1)
+
+def numpy_score_matrix(sent_tokens, list_tokens, score_cutoff=0):
+    """
+    Vectorized backend using a bit-parallel longest common subsequence kernel (Hyyro) over the whole block.
+    fuzz.ratio backed by python-Levenshtein is 2*LCS/(len1+len2), which is what this computes.
+    """
+    scores = np.zeros((len(sent_tokens), len(list_tokens)), dtype=np.int16)
+    if not sent_tokens or not list_tokens:
+        return scores
+
+    #one bitmask per (character, list token) marking where the character sits in the token
+    char_codes = {}
+    long_cols = []
+    for col, word in enumerate(list_tokens):
+        if len(word) > MAX_BITS:
+            long_cols.append(col)
+            continue
+        for char in word:
+            char_codes.setdefault(char, len(char_codes) + 1)
+    match_masks = np.zeros((len(char_codes) + 1, len(list_tokens)), dtype=np.uint64)
+    for col, word in enumerate(list_tokens):
+        if len(word) > MAX_BITS:
+            continue
+        for pos, char in enumerate(word):
+            match_masks[char_codes[char], col] |= np.uint64(1 << pos)
+
+    sent_len = np.array([len(sent_word) for sent_word in sent_tokens], dtype=np.int32)
+    list_len = np.array([min(len(word), MAX_BITS) for word in list_tokens], dtype=np.int32)
+    sent_codes = np.zeros((len(sent_tokens), max(sent_len.max(), 1)), dtype=np.int32)
+    for row, sent_word in enumerate(sent_tokens):
+        sent_codes[row, :len(sent_word)] = [char_codes.get(char, 0) for char in sent_word]
+
+    #characters of the sentence tokens are fed one position at a time to every pair in the block
+    bits = np.full((len(sent_tokens), len(list_tokens)), np.iinfo(np.uint64).max, dtype=np.uint64)
+    for pos in range(sent_codes.shape[1]):
+        matched = bits & match_masks[sent_codes[:, pos]]
+        bits = (bits + matched) | (bits - matched)
+
+    list_masks = np.array([(1 << int(length)) - 1 for length in list_len], dtype=np.uint64)
+    lcs = list_len[np.newaxis, :] - popcount(bits & list_masks[np.newaxis, :])
+    total_len = sent_len[:, np.newaxis] + list_len[np.newaxis, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.rint(100 * ((total_len - (total_len - 2 * lcs)) / total_len))
+    scores[:] = np.where(total_len == 0, 100, ratio)
+
+    for col in long_cols:
+        for row, sent_word in enumerate(sent_tokens):
+            scores[row, col] = indel_ratio(sent_word, list_tokens[col])
+
+    scores[scores < np.asarray(score_cutoff)] = 0
+    return scores
+
+SIMILARITY_BACKENDS = {
+    'fuzzywuzzy': fuzzywuzzy_score_matrix,
+    'numpy': numpy_score_matrix,
+}
+
+def get_score_matrix(backend=DEFAULT_BACKEND):
+    """Look up a similarity backend by name."""
+    if backend not in SIMILARITY_BACKENDS:
+        raise ValueError(f"Unknown similarity backend '{backend}'. Choose from: {', '.join(SIMILARITY_BACKENDS)}")
+    if backend == 'numpy' and not LEVENSHTEIN_RATIO:
+        warnings.warn("python-Levenshtein is not installed, so fuzz.ratio uses difflib and the numpy backend's "
+                      "scores will differ from it on some pairs", RuntimeWarning)
+    return SIMILARITY_BACKENDS[backend]
+
+#PARITY CHECK-------------------------------------
+def check_backend_parity(sent_tokens, list_tokens, backends=None, score_cutoff=0):
+    """
+    Score the same block with every backend and return the pairs where they disagree with the reference.
+    Returns a list of (backend, sent_word, list_word, reference_score, backend_score).
+    """
+    backends = backends or list(SIMILARITY_BACKENDS)
+    reference = fuzzywuzzy_score_matrix(sent_tokens, list_tokens, score_cutoff)
+    mismatches = []
+    for backend in backends:
+        scores = get_score_matrix(backend)(sent_tokens, list_tokens, score_cutoff)
+        for row, col in zip(*np.nonzero(scores != reference)):
+            mismatches.append((backend, sent_tokens[row], list_tokens[col], int(reference[row, col]), int(scores[row, col])))
+    return mismatches
+
+def random_tokens(count, alphabet='abcdeilnorst', max_len=12, seed=0):
+    """Random lowercase tokens for parity checks, including empty and repeated tokens."""
+    rng = random.Random(seed)
+    return [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, max_len))) for _ in range(count)]
+
+if __name__ == "__main__":
+    # python -m wordfinder.similarity runs the backend parity check against fuzz.ratio
+    sent_tokens = random_tokens(300, seed=1) + ['energy', 'energies', 'program', 'x' * 80]
+    list_tokens = random_tokens(200, seed=2) + ['energy', 'programs', 'x' * 70, '']
+    if not LEVENSHTEIN_RATIO:
+        print('fuzzywuzzy is using difflib.SequenceMatcher; install python-Levenshtein for an exact parity check')
+    failures = 0
+    for score_cutoff in (0, 75):
+        mismatches = check_backend_parity(sent_tokens, list_tokens, score_cutoff=score_cutoff)
+        failures += len(mismatches)
+        print(f'score_cutoff={score_cutoff}: {len(mismatches)} mismatching pairs')
+        for mismatch in mismatches[:10]:
+            print('  ', mismatch)
+    sys.exit(1 if failures else 0)
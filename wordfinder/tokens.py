@@ -0,0 +1,101 @@
+"""
+Tokenizing and interning shared by the sentences and the word lists.
+Every normalized token gets a stable integer id in a Vocabulary. The word list tokens come first, then the
+whitelist tokens, so a document token that is on either list gets the same id as the list entry. The matcher
+then compares ids instead of strings.
+"""
+import re
+from array import array
+
+STRIP_CHARS = ".,:;()!?\'\"\\" # punctuation trimmed from both ends of every token
+# optional per term threshold at the end of a word list line, e.g. "ada | 100" or "decarbonization | 70"
+TERM_SENSITIVITY = re.compile(r'^(.*?)\s*\|\s*(\d{1,3})$')
+
+#FUNCTIONS TO TOKENIZE-------------------------------------
+def normalize_token(word):
+    """Trim the surrounding punctuation of one whitespace separated word."""
+    return word.strip(STRIP_CHARS)
+
+def tokenize_sent(sentence):
+    # Tokenize the sentence into words
+    sent_words = [normalize_token(sent) for sent in sentence.split()]
+    return sent_words
+
+def tokenize_word(word_list):
+    # Tokenize the word list into words
+    '''
+        {
+        'word_orig': 'clean energy',
+        'word_tokens': ['clean','energy'],
+        'phrase_type': 'single_word'(or 'multi_word' or 'general'),
+        'sensitivity': None (or the lowest certainty this entry accepts, from a "| 90" suffix),
+        }
+    '''
+
+    token_items = []
+    for phrase in word_list:
+        sensitivity = None
+        term_match = TERM_SENSITIVITY.match(phrase)
+        if term_match and term_match.group(1) and 1 <= int(term_match.group(2)) <= 100:
+            phrase, sensitivity = term_match.group(1), int(term_match.group(2))
+        word_tokens = [normalize_token(word) for word in phrase.split()]
+
+        if len(word_tokens) == 1:
+            phrase_type = 'single_word'
+        else:
+            phrase_type = 'multi_word'
+
+        token_items.append({
+            'word_orig': phrase,
+            'word_tokens': word_tokens,
+            'phrase_type': phrase_type,
+            'sensitivity': sensitivity
+        })
+
+    return token_items
+
+#FUNCTIONS TO INTERN TOKENS-------------------------------------
+class Vocabulary:
+    """Normalized tokens and their integer ids, handed out in first seen order."""
+
+    def __init__(self, tokens=()):
+        self.tokens = []
+        self.ids = {}
+        for token in tokens:
+            self.add(token)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def add(self, token):
+        """Return the id of token, giving it the next free id when it is new."""
+        token_id = self.ids.get(token)
+        if token_id is None:
+            token_id = self.ids[token] = len(self.tokens)
+            self.tokens.append(token)
+        return token_id
+
+    def get(self, token):
+        """Return the id of token, or None when it is not in the vocabulary."""
+        return self.ids.get(token)
+
+    def copy(self):
+        """Independent vocabulary with the same ids, e.g. to extend a compiled word list's vocabulary per document."""
+        vocabulary = Vocabulary()
+        vocabulary.tokens = list(self.tokens)
+        vocabulary.ids = dict(self.ids)
+        return vocabulary
+
+def intern_sentences(sentence_list, vocabulary):
+    """
+    Tokenize every lowercased sentence and store it as ids in vocabulary. New tokens are added to vocabulary.
+    Returns a CSR pair (offsets, token_ids) where the tokens of the i-th sentence are
+    token_ids[offsets[i]:offsets[i + 1]].
+    """
+    offsets = array('I', [0])
+    token_ids = array('I')
+    for sent_item in sentence_list:
+        for sent_word in tokenize_sent(sent_item['sentence'].lower()):
+            token_ids.append(vocabulary.add(sent_word))
+        offsets.append(len(token_ids))
+    return offsets, token_ids
@@ -0,0 +1,81 @@
+"""
+Loading of the search and excluded word lists and their compilation into the structures the matcher uses.
+A compiled word list is built once and can be shared by every document scanned against it.
+"""
+import io
+import os
+from collections import defaultdict, namedtuple
+
+from wordfinder.cache import CACHE_DIR, DiskCache, MemoryCache, TieredCache, content_hash
+from wordfinder.matching import build_automaton, build_phrase_index, build_word_index
+from wordfinder.tokens import Vocabulary, tokenize_word
+
+# bump when CompiledWordList or the way it is built changes so stale cache entries are not reused
+COMPILE_VERSION = '4'
+
+# Word list and whitelist compiled for matching:
+# token_word_dict  tokenize_word output, one item per list entry
+# vocabulary       Vocabulary of the list tokens followed by the whitelist tokens; documents are interned into a copy
+# list_vocab       distinct list tokens, their position is the list token id (the same id as in vocabulary)
+# entry_ids        token ids of every entry of token_word_dict
+# word_index       list tokens bucketed by length for candidate pruning
+# phrase_index     {token id: [multi word phrase positions]} with phrase_sizes {position: distinct token count}
+# single_positions {list token id: [single word phrase positions]}
+# white_ids        token ids of the lowercased excluded words
+# automaton        Aho-Corasick automaton over the entry ids for the exact match modes
+CompiledWordList = namedtuple('CompiledWordList', [
+    'token_word_dict', 'vocabulary', 'list_vocab', 'entry_ids', 'word_index', 'phrase_index', 'phrase_sizes',
+    'single_positions', 'white_ids', 'automaton',
+])
+
+#FUNCTIONS TO LOAD THE WORD LIST-------------------------------------
+def parse_word_list(data):
+    """Lowercased non-empty lines of the raw bytes of a word list or white list TXT file."""
+    with io.TextIOWrapper(io.BytesIO(data)) as file:
+        return [line.strip().lower() for line in file.readlines() if line.strip()]
+
+#FUNCTIONS TO COMPILE THE WORD LIST-------------------------------------
+def compile_word_list(word_list, white_list=()):
+    """Tokenize the word list and build its indexes once so it can be matched against any number of documents."""
+    token_word_dict = tokenize_word(word_list)
+    vocabulary = Vocabulary()
+    entry_ids = [tuple(vocabulary.add(word) for word in word_phrase['word_tokens']) for word_phrase in token_word_dict]
+    list_vocab = list(vocabulary.tokens)
+    # whitelist tokens come after the list tokens so the list token ids stay 0..len(list_vocab)-1
+    white_ids = frozenset(vocabulary.add(word) for word in white_list)
+    single_positions = defaultdict(list)
+    for position, word_phrase in enumerate(token_word_dict):
+        if word_phrase['phrase_type'] == 'single_word':
+            single_positions[entry_ids[position][0]].append(position)
+    phrase_index, phrase_sizes = build_phrase_index(token_word_dict, entry_ids)
+    return CompiledWordList(
+        token_word_dict=token_word_dict,
+        vocabulary=vocabulary,
+        list_vocab=list_vocab,
+        entry_ids=entry_ids,
+        word_index=build_word_index(list_vocab),
+        phrase_index=phrase_index,
+        phrase_sizes=phrase_sizes,
+        single_positions=dict(single_positions),
+        white_ids=white_ids,
+        automaton=build_automaton(entry_ids),
+    )
+
+# compiled word lists shared by every session of this server process and persisted across restarts
+WORD_LIST_CACHE = TieredCache(MemoryCache(max_items=16), DiskCache(os.path.join(CACHE_DIR, 'word_lists')))
+
+def word_list_key(word_data, white_data=b''):
+    """Cache key of a compiled word list: a hash of the raw word list and whitelist contents."""
+    return content_hash(COMPILE_VERSION, word_data, white_data)
+
+def cached_compile_word_list(word_data, white_data=b'', cache=WORD_LIST_CACHE):
+    """
+    compile_word_list for the raw bytes of a word list and optional whitelist, reusing the compiled
+    result of any earlier run with the same contents from memory or disk.
+    """
+    key = word_list_key(word_data, white_data)
+    compiled = cache.get(key)
+    if compiled is None:
+        compiled = compile_word_list(parse_word_list(word_data), parse_word_list(white_data) if white_data else [])
+        cache.put(key, compiled)
+    return compiled